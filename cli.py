@@ -0,0 +1,308 @@
+"""
+Groq Prompt Generator - обработка папки чанков без GUI (серверы без Tk и звука).
+
+Настройки берутся из config.json, флаги командной строки их переопределяют.
+Прогресс - в stdout (текстом или JSON-строками с --json), лог - в stderr.
+
+Запуск: python -m cli --chunks ./chunks --output ./prompts --model llama-3.1-8b-instant --json
+
+Коды выхода: 0 - все чанки обработаны, 1 - часть чанков не обработана,
+2 - ошибка настроек (нет папки, ключей, чанков), 3 - уже запущен другой экземпляр,
+130 - прервано (Ctrl+C).
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+from config.settings import ConfigManager
+from logic.api_client import GroqAPIClient
+from logic.batch_runner import BatchRunner
+from logic.capacity_planner import CapacityPlanner
+from logic.file_processor import FileProcessor
+from logic.key_manager import KeyManager
+from logic.response_cache import ResponseCache
+from logic.traffic_tape import replay_workspace
+from utils.lock_file import LockFileManager
+from utils.logger import Logger
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CONFIG = 2
+EXIT_LOCKED = 3
+EXIT_INTERRUPTED = 130
+
+# Как часто повторять обратный отсчёт, пока все ключи на лимите, сек
+WAIT_REPORT_INTERVAL = 60
+
+
+class ProgressReporter:
+    """Прогресс обработки в stdout: строка текста или JSON-объект на событие"""
+
+    def __init__(self, total, as_json=False):
+        self.total = total
+        self.as_json = as_json
+        self.done = 0
+        self.failed = 0
+        self.statuses = {}
+        self.started = time.monotonic()
+        # Когда последний раз сообщали об ожидании квоты (None - сейчас не ждём)
+        self.wait_reported = None
+
+    def emit(self, event, **fields):
+        """JSON-событие"""
+        print(json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str), flush=True)
+
+    def start(self, model):
+        """Начало задания"""
+        if self.as_json:
+            self.emit("start", files=self.total, model=model)
+        else:
+            print(f"🚀 Запуск обработки: {self.total} файлов, модель {model}", flush=True)
+
+    def file_done(self, file_path, success, status, elapsed):
+        """Файл обработан (или нет)"""
+        self.done += 1
+        if not success:
+            self.failed += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        if self.as_json:
+            self.emit(
+                "file", file=file_path.name, success=success, status=status,
+                elapsed=round(elapsed, 3), done=self.done, total=self.total
+            )
+            return
+
+        mark = "✅" if success else "⚠️"
+        print(f"[{self.done}/{self.total}] {mark} {file_path.name}: {status} ({elapsed:.1f} с)", flush=True)
+
+    def wait(self, seconds):
+        """Все ключи на лимите: в начале ожидания и дальше раз в WAIT_REPORT_INTERVAL"""
+        now = time.monotonic()
+        if self.wait_reported is not None and now - self.wait_reported < WAIT_REPORT_INTERVAL:
+            return
+        self.wait_reported = now
+
+        if self.as_json:
+            self.emit("wait", seconds=round(seconds, 1))
+        else:
+            print(f"⏳ Все ключи на лимите - продолжение через {int(seconds) + 1} с", flush=True)
+
+    def resume(self):
+        """Ожидание квоты закончилось"""
+        self.wait_reported = None
+
+    def summary(self, stopped, exit_code):
+        """Итог задания"""
+        elapsed = time.monotonic() - self.started
+        if self.as_json:
+            self.emit(
+                "summary", files=self.total, processed=self.done - self.failed, failed=self.failed,
+                not_started=self.total - self.done, statuses=self.statuses, stopped=stopped,
+                elapsed=round(elapsed, 1), exit_code=exit_code
+            )
+            return
+
+        minutes, seconds = int(elapsed // 60), int(elapsed % 60)
+        title = "⏹️ Остановлено" if stopped else "🎉 Завершено"
+        print(
+            f"{title}: {self.done - self.failed}/{self.total} файлов за {minutes}м {seconds}с, "
+            f"не обработано {self.failed}, статусы: {self.statuses}",
+            flush=True
+        )
+
+
+def parse_args(argv=None):
+    """Флаги командной строки (не указанные берутся из config.json)"""
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Обработка папки чанков без GUI")
+    parser.add_argument("--config", default="config.json", help="файл настроек")
+    parser.add_argument("--keys-file", default="API_keys.txt", help="файл API ключей")
+    parser.add_argument("--chunks", help="папка с чанками (chunks_folder)")
+    parser.add_argument("--output", help="папка для промптов (prompts_folder)")
+    parser.add_argument("--model")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--prompts-count", type=int)
+    parser.add_argument("--system-prompt-file", help="файл с системным промптом (вместо config.json)")
+    parser.add_argument("--concurrency", type=int, help="параллельных запросов, 0 - по числу ключей")
+    parser.add_argument("--delay", type=float)
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=None, help="кэш ответов")
+    parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=None, help="журнал задания")
+    parser.add_argument("--pack", action=argparse.BooleanOptionalAction, default=None, help="упаковка чанков")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=None, help="потоковые ответы")
+    parser.add_argument("--fallback", action=argparse.BooleanOptionalAction, default=None, help="резервные модели")
+    parser.add_argument("--wait", action=argparse.BooleanOptionalAction, default=None,
+                        help="ждать сброса лимитов, когда все ключи исчерпаны")
+    parser.add_argument("--record", help="записать трафик на ленту (JSONL)")
+    parser.add_argument("--replay", help="отвечать с ленты вместо API (ключи-заглушки, состояние ключей не меняется)")
+    parser.add_argument("--dry-run", action="store_true", help="только прогноз, без запросов")
+    parser.add_argument("--force", action="store_true", help="запуск, даже если найден lock-файл")
+    parser.add_argument("--json", action="store_true", help="прогресс JSON-строками")
+    parser.add_argument("--verbose", action="store_true", help="полный лог в stderr")
+    parser.add_argument("--quiet", action="store_true", help="в stderr только ошибки")
+    return parser.parse_args(argv)
+
+
+def apply_args(settings, config, args):
+    """Переопределить настройки флагами"""
+    overrides = {
+        "output_folder": args.output,
+        "model": args.model,
+        "temperature": args.temperature,
+        "prompts_count": args.prompts_count,
+        "max_concurrent": args.concurrency,
+        "delay": args.delay,
+        "use_cache": args.cache,
+        "resume": args.resume,
+        "pack_requests": args.pack,
+        "stream": args.stream,
+        "use_fallback": args.fallback,
+        "wait_for_capacity": args.wait
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            settings[key] = value
+
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, 'r', encoding='utf-8') as f:
+            settings["system_prompt"] = f.read().strip()
+
+    # Настройки, которые читает сам клиент (в памяти, config.json не перезаписывается)
+    if args.record:
+        config.config["traffic_record"] = args.record
+    if args.replay:
+        config.config["traffic_replay"] = args.replay
+    return settings
+
+
+def main(argv=None):
+    """Точка входа; возвращает код выхода"""
+    args = parse_args(argv)
+
+    min_level = "info" if args.verbose else ("error" if args.quiet else "warning")
+    logger = Logger(stream=sys.stderr, min_level=min_level)
+
+    if not os.path.exists(args.config):
+        logger.log(f"❌ Файл настроек {args.config} не найден", "error")
+        return EXIT_CONFIG
+    config = ConfigManager(args.config)
+
+    try:
+        settings = apply_args(BatchRunner.settings_from_config(config), config, args)
+    except OSError as e:
+        logger.log(f"❌ Не удалось прочитать системный промпт: {str(e)}", "error")
+        return EXIT_CONFIG
+
+    chunks_folder = args.chunks or config.get("chunks_folder", "")
+    if not chunks_folder or not os.path.isdir(chunks_folder):
+        logger.log(f"❌ Папка с чанками не найдена: '{chunks_folder}'", "error")
+        return EXIT_CONFIG
+    if not settings["output_folder"]:
+        logger.log("❌ Не задана папка для промптов (--output или prompts_folder)", "error")
+        return EXIT_CONFIG
+    if not settings["system_prompt"]:
+        logger.log("❌ Пустой системный промпт (--system-prompt-file или system_prompt)", "error")
+        return EXIT_CONFIG
+    os.makedirs(settings["output_folder"], exist_ok=True)
+
+    # Воспроизведение ленты не трогает общее состояние: ключи-заглушки, свой файл лимитов, без кэша ответов
+    replay = bool(config.get("traffic_replay"))
+    key_options = dict(
+        keys_file=args.keys_file,
+        backend=config.get("state_backend", "json"),
+        watch_interval=config.get("keys_watch_interval", 2.0)
+    )
+    if replay:
+        try:
+            keys_file, limits_file = replay_workspace(config.get("traffic_replay"))
+        except OSError as e:
+            logger.log(f"❌ Не удалось прочитать ленту: {str(e)}", "error")
+            return EXIT_CONFIG
+        key_options = dict(keys_file=keys_file, limits_file=limits_file, backend="json", watch_interval=0)
+        settings["use_cache"] = False
+
+    lock_manager = LockFileManager(logger=logger)
+    locked = not args.dry_run and not replay
+    if locked and not lock_manager.check_lock_file(force=args.force):
+        return EXIT_LOCKED
+
+    keys = None
+    api_client = None
+    try:
+        keys = KeyManager(logger=logger, **key_options)
+        if not keys.api_keys:
+            return EXIT_CONFIG
+
+        api_client = GroqAPIClient(keys, logger, config)
+        response_cache = ResponseCache(
+            max_size_mb=config.get("response_cache_max_mb", 200),
+            max_age_days=config.get("response_cache_max_age_days", 30),
+            logger=logger
+        )
+        processor = FileProcessor(api_client, logger, response_cache)
+        runner = BatchRunner(keys, api_client, processor, settings, logger=logger)
+
+        if args.dry_run:
+            planner = CapacityPlanner(
+                keys, settings["model"], settings["system_prompt"], settings["prompts_count"],
+                max_concurrent=settings["max_concurrent"], logger=logger
+            )
+            report = planner.plan(processor.get_files_to_process(chunks_folder))
+            if args.json:
+                print(json.dumps(report, ensure_ascii=False, default=str), flush=True)
+            else:
+                print(planner.format_report(report), flush=True)
+            return EXIT_OK
+
+        files = runner.prepare(chunks_folder)
+        reporter = ProgressReporter(len(files), as_json=args.json)
+        if not files:
+            if args.json:
+                reporter.summary(False, EXIT_OK)
+            else:
+                print("✅ Все чанки уже обработаны с текущими настройками", flush=True)
+            return EXIT_OK
+
+        # Первый Ctrl+C - мягкая остановка (файлы в работе дописываются), второй - сразу
+        stop = {"requested": False}
+
+        def on_interrupt(signum, frame):
+            if stop["requested"]:
+                raise KeyboardInterrupt
+            stop["requested"] = True
+            logger.log("⏹️ Остановка... (повторный Ctrl+C - прервать сразу)", "warning")
+
+        signal.signal(signal.SIGINT, on_interrupt)
+
+        reporter.start(settings["model"])
+        runner.run(
+            files,
+            on_file_done=reporter.file_done,
+            should_stop=lambda: stop["requested"],
+            on_wait=reporter.wait,
+            on_resume=reporter.resume
+        )
+
+        if stop["requested"]:
+            exit_code = EXIT_INTERRUPTED
+        elif reporter.failed or reporter.done < reporter.total:
+            exit_code = EXIT_FAILED
+        else:
+            exit_code = EXIT_OK
+        reporter.summary(stop["requested"], exit_code)
+        return exit_code
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        if keys:
+            keys.close()
+        if api_client:
+            api_client.http.close()
+        if locked:
+            lock_manager.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
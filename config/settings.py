@@ -18,7 +18,33 @@ class ConfigManager:
             "system_prompt": "",
             "prompts_count": 5,
             "delay": 1,
-            "save_raw_responses": False
+            "save_raw_responses": False,
+            "max_concurrent_requests": 0,
+            "http_pool_per_key": False,
+            "http_pool_size": 32,
+            "http_idle_timeout": 300,
+            "http_warm_up": True,
+            "use_response_cache": True,
+            "response_cache_max_mb": 200,
+            "response_cache_max_age_days": 30,
+            "resume_jobs": True,
+            "state_backend": "json",
+            "keys_watch_interval": 2.0,
+            "use_model_fallback": True,
+            "model_fallbacks": None,
+            "wait_for_capacity": True,
+            "pack_requests": False,
+            "pack_max_tokens": 4000,
+            "pack_max_chunks": 5,
+            "stream_responses": False,
+            "traffic_record": "",
+            "traffic_replay": "",
+            "traffic_replay_speed": 1.0,
+            "traffic_replay_strict": False,
+            "log_max_lines": 5000,
+            "log_spill_file": "logs/app.log",
+            "log_spill_max_mb": 5,
+            "log_spill_backups": 3
         }
         
         if os.path.exists(self.config_file):
@@ -1,15 +1,51 @@
 import tkinter as tk
-from tkinter import scrolledtext
+from tkinter import scrolledtext, ttk
+
+from utils.log_buffer import LEVEL_FILTERS, LogBuffer, LogRecord
 
 class LogTab:
-    """Вкладка логов"""
+    """Вкладка логов.
+    
+    В окне - не больше max_lines последних строк (кольцевой буфер LogBuffer),
+    старые строки уходят в файл с ротацией. Фильтр уровня и поиск перестраивают
+    окно по буферу, а не по тексту виджета.
+    """
     
-    def __init__(self, parent):
+    def __init__(self, parent, max_lines=5000, spill_path="logs/app.log", spill_max_mb=5, spill_backups=3):
         self.parent = parent
+        self.buffer = LogBuffer(max_lines, spill_path, spill_max_mb, spill_backups)
+        self.levels = None
+        self.query = ""
+        self.found = 0
         self.create_tab()
     
     def create_tab(self):
         """Создание вкладки логов"""
+        # Панель фильтра и поиска
+        toolbar = tk.Frame(self.parent, bg="#ffffff")
+        toolbar.pack(fill=tk.X, padx=10, pady=(10, 0))
+        
+        tk.Label(toolbar, text="Уровень:", bg="#ffffff", fg="black").pack(side=tk.LEFT)
+        self.level_var = tk.StringVar(value="Все")
+        level_combo = ttk.Combobox(
+            toolbar, textvariable=self.level_var, values=list(LEVEL_FILTERS), width=24, state="readonly"
+        )
+        level_combo.pack(side=tk.LEFT, padx=5)
+        level_combo.bind("<<ComboboxSelected>>", lambda event: self.apply_filter())
+        
+        tk.Label(toolbar, text="🔍", bg="#ffffff", fg="black").pack(side=tk.LEFT, padx=(15, 0))
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(
+            toolbar, textvariable=self.search_var, width=30, bg="white", fg="black", insertbackground="black"
+        )
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind("<Return>", lambda event: self.apply_filter())
+        tk.Button(toolbar, text="Найти", command=self.apply_filter).pack(side=tk.LEFT)
+        tk.Button(toolbar, text="✖", command=self.clear_filter).pack(side=tk.LEFT, padx=5)
+        
+        self.count_label = tk.Label(toolbar, text="", bg="#ffffff", fg="#555555", font=("Arial", 9))
+        self.count_label.pack(side=tk.RIGHT)
+        
         # Текстовое поле с прокруткой
         self.log_text = scrolledtext.ScrolledText(
             self.parent,
@@ -29,5 +65,76 @@ class LogTab:
         self.log_text.tag_config("info", foreground="#0066cc")     # Синий
     
     def get_widget(self):
-        """Получить виджет лога для передачи в Logger"""
+        """Получить виджет лога"""
         return self.log_text
+    
+    def append(self, lines):
+        """Добавить строки [(текст, уровень)] (только из UI-потока - Logger.drain)"""
+        records = [LogRecord(text, level) for text, level in lines]
+        self.buffer.append(records)
+        
+        shown = [record for record in records if record.matches(self.levels, self.query)]
+        self.found = min(self.found + len(shown), len(self.buffer))
+        if shown:
+            self.insert_records(shown)
+            self.trim()
+        self.update_count_label()
+    
+    def insert_records(self, records):
+        """Вставить строки одним insert (подряд идущие строки одного уровня - один фрагмент)"""
+        # Прокручиваем вниз, только если пользователь не листает историю
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        
+        chunks = []
+        for record in records:
+            if chunks and chunks[-1][1] == record.level:
+                chunks[-1][0].append(record.text)
+            else:
+                chunks.append(([record.text], record.level))
+        
+        args = []
+        for texts, level in chunks:
+            args.extend(("".join(texts), level))
+        self.log_text.insert("end", *args)
+        
+        if at_bottom:
+            self.log_text.see("end")
+    
+    def trim(self):
+        """Удалить из виджета строки сверх размера буфера"""
+        lines = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        excess = lines - self.buffer.max_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+    
+    def apply_filter(self):
+        """Перестроить окно по фильтру уровня и строке поиска"""
+        self.levels = LEVEL_FILTERS.get(self.level_var.get())
+        self.query = self.search_var.get().strip().lower()
+        
+        self.log_text.delete("1.0", "end")
+        records = self.buffer.filtered(self.levels, self.query)
+        if records:
+            self.insert_records(records)
+            self.log_text.see("end")
+        self.found = len(records)
+        self.update_count_label()
+    
+    def clear_filter(self):
+        """Сбросить фильтр и поиск"""
+        self.level_var.set("Все")
+        self.search_var.set("")
+        self.apply_filter()
+    
+    def update_count_label(self):
+        """Сколько строк в буфере и сколько ушло в файл"""
+        text = f"В памяти: {len(self.buffer)} из {self.buffer.max_lines}"
+        if self.levels or self.query:
+            text = f"Найдено: {self.found} | " + text
+        if self.buffer.spilled:
+            text += f" | в файле {self.buffer.spill_path}: {self.buffer.spilled}"
+        self.count_label.config(text=text)
+    
+    def close(self):
+        """Дописать буфер в файл"""
+        self.buffer.close()
@@ -2,12 +2,13 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import time
-import winsound
-from pathlib import Path
 
 from gui.settings_tab import SettingsTab
 from gui.stats_tab import StatsTab
 from gui.log_tab import LogTab
+from logic.batch_runner import BatchRunner
+from logic.capacity_planner import CapacityPlanner
+from utils.desktop import beep
 
 class MainWindow:
     """Главное окно приложения"""
@@ -29,6 +30,8 @@ class MainWindow:
         self.start_time = None
         self.processing_times = []
         self.overwrite_all = None
+        self.job_settings = {}
+        self.runner = None
         
         self.setup_window()
         self.create_gui()
@@ -129,10 +132,16 @@ class MainWindow:
         
         tab3 = tk.Frame(self.notebook, bg="#ffffff")
         self.notebook.add(tab3, text="📝 Лог")
-        self.log_tab = LogTab(tab3)
+        self.log_tab = LogTab(
+            tab3,
+            max_lines=self.config.get("log_max_lines", 5000),
+            spill_path=self.config.get("log_spill_file", "logs/app.log"),
+            spill_max_mb=self.config.get("log_spill_max_mb", 5),
+            spill_backups=self.config.get("log_spill_backups", 3)
+        )
         
-        # Подключаем виджет лога к логгеру
-        self.logger.set_widget(self.log_tab.get_widget())
+        # Подключаем окно лога к логгеру (строки из потоков - через очередь и root.after)
+        self.logger.set_widget(self.log_tab, self.root)
         
         # Кнопки управления
         button_frame = tk.Frame(self.root, bg="#f0f0f0")
@@ -179,6 +188,12 @@ class MainWindow:
             width=18, height=1, cursor="hand2", relief=tk.RAISED, bd=3
         ).pack(side=tk.LEFT, padx=5)
 
+        tk.Button(
+            row2, text="📐 Прогноз", command=self.dry_run,
+            font=("Arial", 11, "bold"), bg="#009988", fg="white",
+            width=18, height=1, cursor="hand2", relief=tk.RAISED, bd=3
+        ).pack(side=tk.LEFT, padx=5)
+
         # ✅ НОВАЯ КНОПКА: Очистить кэш
         tk.Button(
             row2, text="🧹 Очистить кэш", command=self.clean_cache,
@@ -195,7 +210,7 @@ class MainWindow:
 
     def update_status_display(self):
         """Обновление панели статуса"""
-        active, on_limit, inactive, nearest_reset = self.keys.get_stats()
+        active, on_limit, inactive, nearest_reset = self.keys.get_stats(self.settings_tab.model_var.get())
         
         reset_text = ""
         if nearest_reset:
@@ -214,7 +229,7 @@ class MainWindow:
         
         # Предупреждение о малом количестве ключей
         if active < 3 and active > 0 and self.is_processing:
-            winsound.Beep(1000, 200)
+            beep(1000, 200)
             messagebox.showwarning("⚠️ Внимание", f"Осталось только {active} активных ключей!")
     
     def periodic_update(self):
@@ -275,6 +290,7 @@ class MainWindow:
             self.total_files = 0
             self.start_time = None
             self.processing_times = []
+            self.keys.reset_session_usage()
             self.logger.log("🔄 Статистика сессии сброшена", "info")
             messagebox.showinfo("✅ Успех", "Статистика сессии сброшена!")
             dialog.destroy()
@@ -285,8 +301,7 @@ class MainWindow:
                                          "Сбросить ВСЮ статистику всех API ключей?\n\n"
                                          "Это удалит все данные об использовании ключей.")
             if result:
-                self.keys.keys_limits = {}
-                self.keys.save_keys_limits()
+                self.keys.reset_all_stats()
                 self.processed_files = 0
                 self.total_files = 0
                 self.start_time = None
@@ -353,12 +368,35 @@ class MainWindow:
             messagebox.showerror("❌ Ошибка", "Нет доступных API ключей!")
             return
         
-        # Получение списка файлов
-        files_to_process = self.processor.get_files_to_process(chunks_folder)
+        # Папка с чанками не пустая
+        if not self.processor.get_files_to_process(chunks_folder):
+            messagebox.showerror("❌ Ошибка", "Папка с чанками пуста!")
+            beep(800, 300)
+            return
         
+        # Снимок настроек (Tk-переменные читаем только из главного потока)
+        self.job_settings = {
+            "output_folder": prompts_folder,
+            "system_prompt": self.settings_tab.system_prompt_text.get(1.0, tk.END).strip(),
+            "model": self.settings_tab.model_var.get(),
+            "temperature": self.settings_tab.temp_var.get(),
+            "prompts_count": self.settings_tab.prompts_count_var.get(),
+            "save_raw": self.settings_tab.save_raw_var.get(),
+            "delay": self.settings_tab.delay_var.get(),
+            "max_concurrent": self.settings_tab.max_concurrent_var.get(),
+            "use_cache": self.settings_tab.use_cache_var.get(),
+            "resume": self.settings_tab.resume_var.get(),
+            "wait_for_capacity": self.settings_tab.wait_capacity_var.get(),
+            "pack_requests": self.settings_tab.pack_requests_var.get(),
+            "stream": self.settings_tab.stream_var.get(),
+            "use_fallback": self.settings_tab.use_fallback_var.get()
+        }
+        
+        # Резервные модели и журнал задания - как в cli.py
+        self.runner = BatchRunner(self.keys, self.api, self.processor, self.job_settings, logger=self.logger)
+        files_to_process = self.runner.prepare(chunks_folder)
         if not files_to_process:
-            messagebox.showerror("❌ Ошибка", "Папка с чанками пуста!")
-            winsound.Beep(800, 300)
+            messagebox.showinfo("✅ Готово", "Все чанки уже обработаны с текущими настройками!")
             return
         
         # Инициализация
@@ -382,6 +420,37 @@ class MainWindow:
         # Запуск в отдельном потоке
         threading.Thread(target=self.process_files, daemon=True).start()
     
+    def dry_run(self):
+        """Прогноз прогона по папке чанков без запросов к API"""
+        chunks_folder = self.settings_tab.chunks_folder_var.get()
+        if not chunks_folder:
+            messagebox.showerror("❌ Ошибка", "Выберите папку с чанками!")
+            return
+        
+        files = self.processor.get_files_to_process(chunks_folder)
+        if not files:
+            messagebox.showerror("❌ Ошибка", "Папка с чанками пуста!")
+            return
+        
+        planner = CapacityPlanner(
+            self.keys,
+            model=self.settings_tab.model_var.get(),
+            system_prompt=self.settings_tab.system_prompt_text.get(1.0, tk.END).strip(),
+            prompts_count=self.settings_tab.prompts_count_var.get(),
+            max_concurrent=self.settings_tab.max_concurrent_var.get(),
+            logger=self.logger
+        )
+        
+        def plan_thread():
+            report = planner.plan(files)
+            text = planner.format_report(report)
+            for line in text.split("\n"):
+                self.logger.log(line, "info")
+            self.root.after(0, lambda: messagebox.showinfo("📐 Прогноз", text))
+        
+        self.logger.log(f"📐 Прогноз по {len(files)} чанкам...", "info")
+        threading.Thread(target=plan_thread, daemon=True).start()
+    
     def toggle_pause(self):
         """Переключение паузы"""
         self.is_paused = not self.is_paused
@@ -400,43 +469,24 @@ class MainWindow:
     
     def process_files(self):
         """Обработка всех файлов (выполняется в отдельном потоке)"""
-        for file_path in self.files_to_process:
-            if self.stop_flag:
-                break
-            
-            # Пауза
-            while self.is_paused and not self.stop_flag:
-                time.sleep(0.5)
-            
-            if self.stop_flag:
-                break
-            
-            # Обработка одного файла
-            file_start = time.time()
-            
-            success, status = self.processor.process_file(
-                file_path=file_path,
-                output_folder=self.settings_tab.prompts_folder_var.get(),
-                system_prompt=self.settings_tab.system_prompt_text.get(1.0, tk.END).strip(),
-                model=self.settings_tab.model_var.get(),
-                temperature=self.settings_tab.temp_var.get(),
-                prompts_count=self.settings_tab.prompts_count_var.get(),
-                save_raw=self.settings_tab.save_raw_var.get()
-            )
-            
+        def on_file_done(file_path, success, status, elapsed):
             if success:
                 self.processed_files += 1
-                file_time = time.time() - file_start
-                self.processing_times.append(file_time)
+                self.processing_times.append(elapsed)
                 
-                # Обновление прогресса
-                self.update_progress()
-                
-                # Задержка между файлами (если ключей <= 5)
-                if len(self.keys.api_keys) <= 5:
-                    delay = self.settings_tab.delay_var.get()
-                    if delay > 0:
-                        time.sleep(delay)
+                # Обновление прогресса (виджеты Tk - только из UI-потока)
+                self.root.after(0, self.update_progress)
+            else:
+                self.logger.log(f"⚠️ {file_path.name}: не обработан ({status})", "warning")
+        
+        self.runner.run(
+            self.files_to_process,
+            on_file_done=on_file_done,
+            should_stop=lambda: self.stop_flag,
+            is_paused=lambda: self.is_paused,
+            on_wait=self.show_capacity_wait,
+            on_resume=lambda: self.root.after(0, self.update_progress)
+        )
         
         # Завершение
         self.finish_processing()
@@ -460,6 +510,16 @@ class MainWindow:
             text=f"📊 Обработано: {self.processed_files}/{self.total_files} ({percent}%) | {eta_text}"
         )
     
+    def show_capacity_wait(self, seconds):
+        """Обратный отсчёт до сброса лимитов (вызывается из рабочих потоков)"""
+        seconds = int(seconds) + 1
+        text = (
+            f"⏳ Все ключи на лимите - продолжение через "
+            f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d} "
+            f"| Обработано: {self.processed_files}/{self.total_files}"
+        )
+        self.root.after(0, lambda: self.progress_label.config(text=text))
+    
     def finish_processing(self):
         """Завершение обработки"""
         self.is_processing = False
@@ -480,7 +540,7 @@ class MainWindow:
         else:
             self.logger.log(f"🎉 Завершено: {self.processed_files}/{self.total_files} файлов за {minutes}м {seconds}с", "success")
             self.progress_label.config(text="✅ Обработка завершена!")
-            winsound.Beep(1000, 500)
+            beep(1000, 500)
     
     def clean_cache(self):
         """🧹 ОТДЕЛЬНАЯ ФУНКЦИЯ: Очистка Python кэша (__pycache__)"""
@@ -102,6 +102,15 @@ class SettingsTab:
         tk.Label(delay_frame, text="(Авто 0 если ключей > 5)", bg="#ffffff", fg="gray", font=("Arial", 8)).pack(side=tk.LEFT, padx=5)
         row += 1
         
+        # Параллельные запросы
+        tk.Label(container, text="🔀 Параллельных запросов:", bg="#ffffff", fg="black", font=("Arial", 10, "bold")).grid(row=row, column=0, sticky=tk.W, pady=10)
+        concurrency_frame = tk.Frame(container, bg="#ffffff")
+        concurrency_frame.grid(row=row, column=1, sticky=tk.W, pady=10)
+        self.max_concurrent_var = tk.IntVar(value=self.config.get("max_concurrent_requests", 0))
+        ttk.Spinbox(concurrency_frame, from_=0, to=256, textvariable=self.max_concurrent_var, width=10, command=self.on_setting_change).pack(side=tk.LEFT)
+        tk.Label(concurrency_frame, text="(0 = по числу активных ключей)", bg="#ffffff", fg="gray", font=("Arial", 8)).pack(side=tk.LEFT, padx=5)
+        row += 1
+        
         # Сохранять сырые ответы
         self.save_raw_var = tk.BooleanVar(value=self.config.get("save_raw_responses", False))
         tk.Checkbutton(
@@ -116,6 +125,90 @@ class SettingsTab:
         ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
         row += 1
         
+        # Кэш ответов API
+        self.use_cache_var = tk.BooleanVar(value=self.config.get("use_response_cache", True))
+        tk.Checkbutton(
+            container,
+            text="💾 Использовать кэш ответов (не отправлять неизменённые чанки повторно)",
+            variable=self.use_cache_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
+        # Продолжение прерванного задания
+        self.resume_var = tk.BooleanVar(value=self.config.get("resume_jobs", True))
+        tk.Checkbutton(
+            container,
+            text="⏭️ Пропускать чанки, уже обработанные с теми же настройками",
+            variable=self.resume_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
+        # Резервные модели при исчерпании квоты
+        self.use_fallback_var = tk.BooleanVar(value=self.config.get("use_model_fallback", True))
+        tk.Checkbutton(
+            container,
+            text="🔀 Переходить на резервную модель, когда квота текущей исчерпана",
+            variable=self.use_fallback_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
+        # Ожидание сброса лимитов
+        self.wait_capacity_var = tk.BooleanVar(value=self.config.get("wait_for_capacity", True))
+        tk.Checkbutton(
+            container,
+            text="⏳ Когда все ключи на лимите - ждать сброса, а не пропускать файлы",
+            variable=self.wait_capacity_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
+        # Упаковка мелких чанков в один запрос
+        self.pack_requests_var = tk.BooleanVar(value=self.config.get("pack_requests", False))
+        tk.Checkbutton(
+            container,
+            text="📦 Отправлять несколько мелких чанков одним запросом (экономит RPM)",
+            variable=self.pack_requests_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
+        # Потоковый ответ
+        self.stream_var = tk.BooleanVar(value=self.config.get("stream_responses", False))
+        tk.Checkbutton(
+            container,
+            text="📡 Потоковый ответ: писать промпты по мере генерации и обрывать лишнее",
+            variable=self.stream_var,
+            bg="#ffffff",
+            fg="black",
+            selectcolor="#e0e0e0",
+            font=("Arial", 10),
+            command=self.on_setting_change
+        ).grid(row=row, column=0, columnspan=2, sticky=tk.W, pady=10)
+        row += 1
+        
         # Папка с чанками
         tk.Label(container, text="📁 Папка с чанками:", bg="#ffffff", fg="black", font=("Arial", 10, "bold")).grid(row=row, column=0, sticky=tk.W, pady=10)
         chunks_frame = tk.Frame(container, bg="#ffffff")
@@ -179,4 +272,11 @@ class SettingsTab:
         self.config.config["prompts_count"] = self.prompts_count_var.get()
         self.config.config["delay"] = self.delay_var.get()
         self.config.config["save_raw_responses"] = self.save_raw_var.get()
+        self.config.config["max_concurrent_requests"] = self.max_concurrent_var.get()
+        self.config.config["use_response_cache"] = self.use_cache_var.get()
+        self.config.config["resume_jobs"] = self.resume_var.get()
+        self.config.config["use_model_fallback"] = self.use_fallback_var.get()
+        self.config.config["wait_for_capacity"] = self.wait_capacity_var.get()
+        self.config.config["pack_requests"] = self.pack_requests_var.get()
+        self.config.config["stream_responses"] = self.stream_var.get()
         self.config.save_config()
@@ -1,9 +1,12 @@
 # gui/stats_tab.py - ПОЛНОСТЬЮ ПЕРЕПИСАТЬ
 
+import threading
 import tkinter as tk
 from tkinter import ttk
 from datetime import datetime
 
+from logic.model_limits import MODEL_LIMITS
+
 
 class StatsTab:
     """Вкладка статистики ключей"""
@@ -11,7 +14,18 @@ class StatsTab:
     def __init__(self, parent, key_manager):
         self.parent = parent
         self.key_manager = key_manager
+        # Строки таблицы: key_id -> id строки Treeview и показанные значения
+        self.rows = {}
+        self.row_values = {}
+        # Ключи на лимите: статус меняется со временем, проверяются при каждом обновлении
+        self.limited = set()
+        self.model = None
+        # Изменения из KeyManager (рабочие потоки) до ближайшего обновления
+        self.dirty = set()
+        self.structure_changed = True
+        self.dirty_lock = threading.Lock()
         self.create_tab()
+        self.key_manager.add_change_listener(self.on_key_changed)
     
     def create_tab(self):
         """Создание вкладки статистики"""
@@ -39,8 +53,6 @@ class StatsTab:
             font=("Segoe UI", 10, "bold") 
         ).pack(anchor="w", padx=10, pady=5)
 
-        from logic.model_limits import MODEL_LIMITS
-
         info_text = ""
         for model_name, model_data in MODEL_LIMITS.items():
             emoji = model_data['name'].split()[0]
@@ -57,6 +69,17 @@ class StatsTab:
         ).pack(anchor="w", padx=20, pady=5)
 
 
+        # Расход токенов за текущий запуск (из usage ответов API)
+        self.usage_label = tk.Label(
+            container,
+            text="",
+            bg="#ffffff",
+            fg="#333333",
+            font=("Arial", 9),
+            justify="left"
+        )
+        self.usage_label.pack(anchor="w", pady=5)
+
         # Настройка стиля таблицы
         style = ttk.Style()
         style.configure("Treeview",
@@ -74,6 +97,7 @@ class StatsTab:
         
         # ✅ НОВАЯ КОЛОНКА: "RPD Лимит"
         columns = ("Ключ", "Запросы", "Токены IN", "Токены OUT", "Промпты", "Файлы", "Ошибки", "Статус", "RPD Лимит")
+        self.columns = columns
         self.stats_tree = ttk.Treeview(container, columns=columns, show='headings', height=20)
         
         for col in columns:
@@ -94,78 +118,146 @@ class StatsTab:
         self.stats_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     
-    def update_display(self, model=None):  # ← ДОБАВЛЯЕМ ПАРАМЕТР model
-        """✅ ИСПРАВЛЕННЫЙ: Обновление отображения таблицы с RPD"""
-        try:
-            from logic.model_limits import MODEL_LIMITS
-        except ImportError:
-            MODEL_LIMITS = {"llama-3.3-70b-versatile": {"rpd": 1_000}}
-        
-        # Очистка таблицы
-        for item in self.stats_tree.get_children():
-            self.stats_tree.delete(item)
-        
-        # ✅ ИСПРАВЛЕНО: Получаем ПЕРЕДАННУЮ модель (или берем из config.json)
-        if model is None:
-            try:
-                import json
-                with open('config.json', 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
-                    model = config_data.get('model', 'llama-3.3-70b-versatile')
-            except:
-                model = 'llama-3.3-70b-versatile'
-        
-        # ✅ Теперь берем правильный лимит для ТЕКУЩЕЙ модели
-        rpd_limit = MODEL_LIMITS.get(model, {}).get('rpd', 1000)
-        
-        # Заполнение таблицы (остальной код без изменений)
-        for key in self.key_manager.api_keys:
-            key_id = key[-8:]
+    def on_key_changed(self, key_id):
+        """Уведомление KeyManager (из рабочих потоков): только запомнить, что изменилось"""
+        with self.dirty_lock:
+            if key_id is None:
+                self.structure_changed = True
+            else:
+                self.dirty.add(key_id)
+    
+    def update_display(self, model=None):
+        """Обновление таблицы: перерисовываются только изменившиеся ключи и ячейки.
+
+        Список строк сверяется с ключами только после изменения набора ключей
+        или смены модели. Ключи на лимите проверяются каждый раз -
+        их статус меняется со временем, без уведомлений.
+        """
+        model = model or self.model or "llama-3.3-70b-versatile"
+        
+        with self.dirty_lock:
+            dirty = self.dirty
+            self.dirty = set()
+            structure_changed = self.structure_changed
+            self.structure_changed = False
+        
+        full = model != self.model
+        self.model = model
+        if structure_changed or full:
+            # Новый набор ключей, перезагрузка состояния или другая модель - сверяем все строки
+            # (в Treeview всё равно уходят только изменившиеся ячейки)
+            self.sync_rows()
+            dirty = set(self.rows)
+        
+        dirty |= self.limited
+        if not dirty:
+            return
+        
+        for key_id in dirty:
+            item = self.rows.get(key_id)
+            if item is None:
+                continue
+            values = self.build_row(key_id, model)
+            old_values = self.row_values.get(key_id)
+            if old_values is None:
+                self.stats_tree.item(item, values=values)
+            else:
+                # Только изменившиеся ячейки
+                for column, old, new in zip(self.columns, old_values, values):
+                    if old != new:
+                        self.stats_tree.set(item, column, new)
+            self.row_values[key_id] = values
             
-            if key_id in self.key_manager.keys_limits:
-                data = self.key_manager.keys_limits[key_id]
-                
-                # Определение статуса
-                if data.get('permanently_invalid', False):
-                    status = "❌ Невалидный"
-                elif data.get('tokens_used_today', 0) >= 14400:
-                    status = "🔴 TPD лимит"
-                elif data.get('requests_this_minute', 0) >= 30:
-                    status = "🟡 RPM лимит"
-                else:
-                    status = "🟢 Активен"
-                
-                # Расчёт RPD статуса с цветовым индикатором
-                total_requests = data.get('total_requests', 0)
-                rpd_percentage = (total_requests / rpd_limit * 100) if rpd_limit > 0 else 0
-                
-                # Цветовой индикатор на основе процента
-                if rpd_percentage < 50:
-                    rpd_indicator = f"🟢 {total_requests}/{rpd_limit} ({rpd_percentage:.0f}%)"
-                elif rpd_percentage < 80:
-                    rpd_indicator = f"🟡 {total_requests}/{rpd_limit} ({rpd_percentage:.0f}%)"
-                else:
-                    rpd_indicator = f"🔴 {total_requests}/{rpd_limit} ({rpd_percentage:.0f}%)"
-                
-                # Вставка в таблицу
-                self.stats_tree.insert('', tk.END, values=(
-                    f"...{key_id}",
-                    data.get('total_requests', 0),
-                    data.get('total_tokens_in', 0),
-                    data.get('total_tokens_out', 0),
-                    data.get('prompts_generated', 0),
-                    data.get('files_processed', 0),
-                    data.get('errors', 0),
-                    status,
-                    rpd_indicator
-                ))
+            if values[7] in ("🟢 Активен", "❌ Невалидный"):
+                self.limited.discard(key_id)
             else:
+                self.limited.add(key_id)
+        
+        self.update_usage_label(model)
+    
+    def sync_rows(self):
+        """Строки таблицы по текущему списку ключей (добавить, удалить, переставить)"""
+        with self.key_manager.state_lock:
+            key_ids = list(dict.fromkeys(key[-8:] for key in self.key_manager.api_keys))
+        
+        wanted = set(key_ids)
+        for key_id in [key_id for key_id in self.rows if key_id not in wanted]:
+            self.stats_tree.delete(self.rows.pop(key_id))
+            self.row_values.pop(key_id, None)
+            self.limited.discard(key_id)
+        
+        for index, key_id in enumerate(key_ids):
+            item = self.rows.get(key_id)
+            if item is None:
+                self.rows[key_id] = self.stats_tree.insert('', index, values=(f"...{key_id}",))
+            elif self.stats_tree.index(item) != index:
+                self.stats_tree.move(item, '', index)
+    
+    def build_row(self, key_id, model):
+        """Значения строки ключа для модели"""
+        default_rpd = MODEL_LIMITS.get(model, {}).get('rpd', 1000)
+        
+        with self.key_manager.state_lock:
+            data = self.key_manager.keys_limits.get(key_id)
+            if data is None:
                 # Ключ ещё не использовался
-                rpd_indicator = f"🟢 0/{rpd_limit} (0%)"
-                
-                self.stats_tree.insert('', tk.END, values=(
+                return (
                     f"...{key_id}",
                     0, 0, 0, 0, 0, 0,
                     "🟢 Активен",
-                    rpd_indicator
-                ))
+                    f"🟢 0/{default_rpd} (0%)"
+                )
+            
+            model_data = data.get('models', {}).get(model, {})
+            key_status, _ = self.key_manager.get_key_status(key_id, model)
+            values = (
+                data.get('total_requests', 0),
+                data.get('total_tokens_in', 0),
+                data.get('total_tokens_out', 0),
+                data.get('prompts_generated', 0),
+                data.get('files_processed', 0),
+                data.get('errors', 0)
+            )
+            # Расход за сутки по этой модели (из заголовков сервера; после сброса окна - 0)
+            requests_used = model_data.get('requests_used', 0) or 0
+            rpd_limit = model_data.get('requests_limit') or default_rpd
+        
+        # Определение статуса
+        if key_status == "invalid":
+            status = "❌ Невалидный"
+        elif key_status == "limit":
+            if requests_used >= rpd_limit:
+                status = "🔴 RPD лимит"
+            else:
+                status = "🟡 TPM лимит"
+        else:
+            status = "🟢 Активен"
+        
+        # Расчёт RPD статуса с цветовым индикатором
+        rpd_percentage = (requests_used / rpd_limit * 100) if rpd_limit > 0 else 0
+        
+        # Цветовой индикатор на основе процента
+        if rpd_percentage < 50:
+            rpd_indicator = f"🟢 {requests_used}/{rpd_limit} ({rpd_percentage:.0f}%)"
+        elif rpd_percentage < 80:
+            rpd_indicator = f"🟡 {requests_used}/{rpd_limit} ({rpd_percentage:.0f}%)"
+        else:
+            rpd_indicator = f"🔴 {requests_used}/{rpd_limit} ({rpd_percentage:.0f}%)"
+        
+        return (f"...{key_id}",) + values + (status, rpd_indicator)
+    
+    def update_usage_label(self, model):
+        """Строка с расходом токенов за запуск: по выбранной модели и всего"""
+        lines = []
+        for title, usage in (
+            (model, self.key_manager.get_session_usage(model)),
+            ("Всего", self.key_manager.get_session_usage())
+        ):
+            requests_count = usage["requests"]
+            avg_queue = usage["queue_time"] / requests_count if requests_count else 0
+            avg_total = usage["total_time"] / requests_count if requests_count else 0
+            lines.append(
+                f"🔢 {title}: запросов {requests_count}, токены IN {usage['tokens_in']:,} / OUT {usage['tokens_out']:,}, "
+                f"очередь {avg_queue:.2f} с, обработка {avg_total:.2f} с"
+            )
+        self.usage_label.config(text="За этот запуск:\n" + "\n".join(lines))
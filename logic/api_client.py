@@ -1,8 +1,14 @@
+import json
 import requests
 import time
-import winsound
 from datetime import datetime
 
+from logic.backoff import compute_cooldown
+from logic.http_pool import SessionPool
+from logic.rate_limiter import estimate_request_tokens
+from logic.traffic_tape import TapeRecorder, TapeReplayer
+from utils.desktop import beep
+
 class GroqAPIClient:
     """Клиент для работы с Groq API"""
     
@@ -10,7 +16,42 @@ class GroqAPIClient:
         self.key_manager = key_manager
         self.logger = logger
         self.config = config
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        # Адрес можно подменить (локальный mock-сервер для бенчмарков)
+        self.api_url = self.get_setting("api_url", "https://api.groq.com/openai/v1/chat/completions")
+        
+        # Keep-alive соединения на весь прогон
+        self.http = SessionPool(
+            per_key=self.get_setting("http_pool_per_key", False),
+            pool_size=self.get_setting("http_pool_size", 32),
+            idle_timeout=self.get_setting("http_idle_timeout", 300),
+            logger=logger
+        )
+        
+        # Запись трафика на ленту или воспроизведение с неё вместо API
+        replay_path = self.get_setting("traffic_replay")
+        record_path = self.get_setting("traffic_record")
+        if replay_path:
+            self.http = TapeReplayer(
+                replay_path,
+                speed=self.get_setting("traffic_replay_speed", 1.0),
+                strict=self.get_setting("traffic_replay_strict", False),
+                logger=logger
+            )
+        elif record_path:
+            self.http = TapeRecorder(self.http, record_path, logger=logger)
+    
+    def get_setting(self, key, default=None):
+        """Значение из config (если он передан)"""
+        if self.config is None:
+            return default
+        return self.config.get(key, default)
+    
+    def warm_up(self, api_keys):
+        """Прогрев соединений перед пакетной обработкой"""
+        if not self.get_setting("http_warm_up", True):
+            return 0
+        connections = min(len(api_keys), self.http.pool_size)
+        return self.http.warm_up(api_keys, self.api_url, connections=connections)
     
     def log(self, message, level="info"):
         """Вывод в лог"""
@@ -34,114 +75,236 @@ class GroqAPIClient:
             return False
         return True
     
-    def send_request(self, user_message, system_prompt, model, temperature, max_retries=3):
-        """Отправка запроса к Groq API с повторами при ошибках"""
+    def build_headers(self, api_key):
+        """Заголовки запроса для ключа"""
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    def build_payload(self, user_message, system_prompt, model, temperature, stream=False):
+        """Тело запроса chat/completions"""
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": temperature
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    def read_stream(self, response, stream):
+        """Чтение ответа по событиям SSE: строки ответа отдаются в stream.feed_line по мере готовности.
+
+        Если stream.feed_line вернул False (нужное число промптов уже есть) - соединение
+        закрывается, и генерация дальше не оплачивается. Возвращает (текст, usage).
+        """
+        stream.reset()
+        parts = []
+        buffer = ""
+        usage = None
+        stopped = False
+        
+        try:
+            for raw in response.iter_lines(decode_unicode=True):
+                if not raw or not raw.startswith("data:"):
+                    continue
+                data = raw[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                event = json.loads(data)
+                # Groq присылает usage в последнем событии (x_groq.usage)
+                usage = event.get("usage") or event.get("x_groq", {}).get("usage") or usage
+                for choice in event.get("choices", []):
+                    delta = choice.get("delta", {}).get("content")
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    buffer += delta
+                    
+                    # Готовые строки - сразу в разбор
+                    while "\n" in buffer:
+                        line, buffer = buffer.split("\n", 1)
+                        if stream.feed_line(line) is False:
+                            stopped = True
+                            break
+                    if stopped:
+                        break
+                if stopped:
+                    break
+            
+            if buffer and not stopped:
+                stream.feed_line(buffer)
+        finally:
+            response.close()
+        
+        if stopped:
+            self.log(f"✂️ Генерация остановлена досрочно: промптов достаточно", "info")
+        return "".join(parts), usage
+    
+    def finish_request(self, answer, status, lease, with_lease):
+        """Результат send_request: с арендой ключа (вызывающий сам её вернёт) или без"""
+        if with_lease:
+            return answer, status, lease
+        if lease:
+            lease.release(status)
+        return answer, status
+    
+    def send_request(self, user_message, system_prompt, model, temperature, max_retries=3, with_lease=False, stream=None):
+        """Отправка запроса к Groq API с повторами при ошибках.
+
+        with_lease=True - возвращает (answer, status, lease), где lease - аренда ключа,
+        обслужившего последнюю попытку (или None). Её нужно вернуть через lease.release().
+        stream - приёмник строк (reset/feed_line): ответ читается потоком SSE.
+        """
         
         # ✅ НОВОЕ: Проверяем модель перед отправкой
         if not self.validate_model(model):
             self.log(f"❌ Модель '{model}' недоступна!", "error")
-            winsound.Beep(800, 500)
-            return None, "invalid_model"
+            beep(800, 500)
+            return self.finish_request(None, "invalid_model", None, with_lease)
+        
+        # Оценка токенов запроса для бюджета TPM/TPD
+        tokens = estimate_request_tokens(
+            system_prompt, user_message, self.key_manager.rate_limiter.get_output_estimate(model)
+        )
+        lease = None
+        outcome = None
         
         for attempt in range(max_retries):
-            # Получаем следующий доступный ключ
-            api_key = self.key_manager.get_next_key()
+            # Неудачная предыдущая попытка - возвращаем её ключ
+            if lease:
+                lease.release(outcome)
+                lease = None
+            
+            # Ждём ключ, у которого есть бюджет по модели
+            lease = self.key_manager.acquire_lease(model, tokens)
             
-            if not api_key:
+            if not lease:
                 self.log("❌ Нет доступных API ключей!", "error")
-                winsound.Beep(800, 500)
-                return None, "no_keys"
+                beep(800, 500)
+                return self.finish_request(None, "no_keys", None, with_lease)
             
-            key_id = api_key[-8:]
+            api_key = lease.api_key
+            key_id = lease.key_id
+            response = None
             
             try:
                 self.log(f"📤 Запрос с ключом ...{key_id} (попытка {attempt + 1}/{max_retries})", "info")
                 
-                response = requests.post(
+                started = time.monotonic()
+                response = self.http.post(
+                    api_key,
                     self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        "temperature": temperature
-                    },
-                    timeout=30
+                    headers=self.build_headers(api_key),
+                    json=self.build_payload(user_message, system_prompt, model, temperature, stream=bool(stream)),
+                    timeout=30,
+                    stream=bool(stream)
                 )
+                latency = time.monotonic() - started
+                lease.latency = latency
                 
                 # Обработка ответа
                 if response.status_code == 200:
                     # Успех
-                    self.key_manager.update_key_limits(api_key, response.headers)
-                    data = response.json()
-                    answer = data['choices'][0]['message']['content']
+                    if stream:
+                        answer, usage = self.read_stream(response, stream)
+                    else:
+                        data = response.json()
+                        answer, usage = data['choices'][0]['message']['content'], data.get('usage')
+                    # usage: фактические токены и время на сервере
+                    lease.record_response(response.headers, latency, usage)
                     self.log(f"✅ Успех с ключом ...{key_id}", "success")
-                    return answer, "success"
+                    return self.finish_request(answer, "success", lease, with_lease)
                 
                 elif response.status_code == 401:
                     # Невалидный ключ
                     self.log(f"❌ Ключ ...{key_id} невалидный (401)", "error")
-                    self.key_manager.mark_key_invalid(api_key)
+                    lease.mark_invalid()
+                    outcome = "invalid"
                     continue
                 
                 elif response.status_code == 429:
-                    # Rate limit - прогрессивная задержка
-                    self.key_manager.update_key_limits(api_key, response.headers)
+                    # Rate limit - паркуем только этот ключ до сброса, указанного сервером
+                    lease.record_response(response.headers, latency)
                     
-                    delays = [5, 10, 15]
-                    if attempt < len(delays):
-                        delay = delays[attempt]
-                        self.log(f"⚠️ Rate limit (429), ожидание {delay} сек...", "warning")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        self.log(f"⚠️ Rate limit (429), переключение ключа", "warning")
-                        continue
+                    cooldown = compute_cooldown(response.headers)
+                    lease.park(cooldown)
+                    self.log(f"⚠️ Rate limit (429), ключ ...{key_id} на паузе {cooldown:.1f} сек", "warning")
+                    outcome = "rate_limited"
+                    continue
                 
                 elif response.status_code == 500:
                     # Ошибка сервера - сразу следующий ключ
                     self.log(f"⚠️ Ошибка сервера (500), переключение ключа", "warning")
+                    outcome = "server_error"
                     continue
                 
                 else:
                     # Другая ошибка
                     self.log(f"❌ Ошибка {response.status_code}: {response.text[:100]}", "error")
+                    outcome = "error"
                     time.sleep(5)
                     continue
             
             except requests.exceptions.Timeout:
                 self.log(f"⚠️ Timeout с ключом ...{key_id}", "warning")
+                outcome = "timeout"
                 time.sleep(5)
                 continue
             
             except requests.exceptions.ConnectionError:
                 self.log(f"⚠️ Ошибка соединения, повтор через 5 сек...", "warning")
+                outcome = "connection_error"
                 time.sleep(5)
                 continue
             
             except Exception as e:
                 self.log(f"❌ Исключение: {str(e)}", "error")
+                outcome = "error"
                 time.sleep(5)
                 continue
+            
+            finally:
+                # Потоковый ответ с ошибкой не дочитывается - возвращаем соединение в пул
+                if stream and response is not None:
+                    response.close()
         
         # Все попытки исчерпаны
         self.log(f"❌ Не удалось выполнить запрос после {max_retries} попыток", "error")
-        return None, "failed"
+        return self.finish_request(None, "failed", lease, with_lease)
+    
+    def send_request_cascade(self, user_message, system_prompt, models, temperature, max_retries=3, stream=None):
+        """Запрос с переходом по цепочке моделей.
+
+        Следующая модель пробуется, только если у всех ключей кончилась квота
+        текущей (no_keys). Возвращает (answer, status, lease, model): lease нужно
+        вернуть через lease.release(), model - модель, которая дала ответ.
+        """
+        status = "no_keys"
+        for i, model in enumerate(models):
+            if i > 0:
+                self.log(f"🔀 Квота {models[i - 1]} исчерпана, переход на {model}", "warning")
+            
+            answer, status, lease = self.send_request(
+                user_message, system_prompt, model, temperature, max_retries, with_lease=True, stream=stream
+            )
+            if status != "no_keys":
+                return answer, status, lease, model
+        
+        return None, status, None, models[-1] if models else None
     
     def test_single_key(self, api_key):
         """Тест одного ключа"""
         try:
-            response = requests.post(
+            response = self.http.post(
+                api_key,
                 self.api_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
+                headers=self.build_headers(api_key),
                 json={
                     "model": "llama-3.3-70b-versatile",
                     "messages": [{"role": "user", "content": "Hi"}],
@@ -151,13 +314,13 @@ class GroqAPIClient:
             )
             
             if response.status_code == 200:
-                self.key_manager.update_key_limits(api_key, response.headers)
+                self.key_manager.update_key_limits(api_key, response.headers, "llama-3.3-70b-versatile")
                 return "ok"
             elif response.status_code == 401:
                 self.key_manager.mark_key_invalid(api_key)
                 return "invalid"
             elif response.status_code == 429:
-                self.key_manager.update_key_limits(api_key, response.headers)
+                self.key_manager.update_key_limits(api_key, response.headers, "llama-3.3-70b-versatile")
                 return "limit"
             else:
                 return "error"
@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from logic.api_client import GroqAPIClient
+from logic.backoff import compute_cooldown
+from logic.rate_limiter import estimate_request_tokens
+
+
+class AsyncGroqAPIClient(GroqAPIClient):
+    """Асинхронный клиент Groq API (aiohttp): один event loop вместо потока на запрос"""
+
+    def __init__(self, key_manager, logger=None, config=None, max_in_flight=100):
+        if aiohttp is None:
+            raise ImportError("Для асинхронного клиента нужен пакет aiohttp: pip install aiohttp")
+        # Запросы идут через aiohttp мимо SessionPool - ленту трафика писать и читать нечем
+        for name in ("traffic_record", "traffic_replay"):
+            if config is not None and config.get(name):
+                raise ValueError(f"Асинхронный клиент не поддерживает {name}: запись и воспроизведение - в GroqAPIClient")
+
+        super().__init__(key_manager, logger, config)
+        self.max_in_flight = max_in_flight
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Создать HTTP-сессию (одна на весь клиент)"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight)
+            )
+        return self.session
+
+    async def close(self):
+        """Закрыть HTTP-сессию"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def acquire_key(self, model, tokens, max_wait=65):
+        """Неблокирующее ожидание ключа с бюджетом по модели"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait
+        while True:
+            api_key, wait = self.key_manager.reserve_key(model, tokens)
+            if api_key or wait is None:
+                return api_key
+            if loop.time() + wait > deadline:
+                return None
+            await asyncio.sleep(wait)
+
+    async def send_request(self, user_message, system_prompt, model, temperature, max_retries=3, with_lease=False):
+        """Отправка запроса к Groq API с повторами при ошибках (не блокирует поток)"""
+
+        if not self.validate_model(model):
+            self.log(f"❌ Модель '{model}' недоступна!", "error")
+            return self.finish_request(None, "invalid_model", None, with_lease)
+
+        session = await self.open()
+        tokens = estimate_request_tokens(
+            system_prompt, user_message, self.key_manager.rate_limiter.get_output_estimate(model)
+        )
+        lease = None
+        outcome = None
+
+        for attempt in range(max_retries):
+            if lease:
+                lease.release(outcome)
+                lease = None
+
+            api_key = await self.acquire_key(model, tokens)
+
+            if not api_key:
+                self.log("❌ Нет доступных API ключей!", "error")
+                return self.finish_request(None, "no_keys", None, with_lease)
+
+            lease = self.key_manager.open_lease(api_key, model, tokens)
+            key_id = lease.key_id
+
+            try:
+                self.log(f"📤 Запрос с ключом ...{key_id} (попытка {attempt + 1}/{max_retries})", "info")
+
+                started = time.monotonic()
+                async with session.post(
+                    self.api_url,
+                    headers=self.build_headers(api_key),
+                    json=self.build_payload(user_message, system_prompt, model, temperature),
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    latency = time.monotonic() - started
+                    lease.latency = latency
+
+                    if response.status == 200:
+                        data = await response.json()
+                        # usage: фактические токены и время на сервере
+                        lease.record_response(response.headers, latency, data.get('usage'))
+                        answer = data['choices'][0]['message']['content']
+                        self.log(f"✅ Успех с ключом ...{key_id}", "success")
+                        return self.finish_request(answer, "success", lease, with_lease)
+
+                    elif response.status == 401:
+                        self.log(f"❌ Ключ ...{key_id} невалидный (401)", "error")
+                        lease.mark_invalid()
+                        outcome = "invalid"
+                        continue
+
+                    elif response.status == 429:
+                        lease.record_response(response.headers, latency)
+
+                        # Паркуем только этот ключ, остальные продолжают сразу
+                        cooldown = compute_cooldown(response.headers)
+                        lease.park(cooldown)
+                        self.log(f"⚠️ Rate limit (429), ключ ...{key_id} на паузе {cooldown:.1f} сек", "warning")
+                        outcome = "rate_limited"
+                        continue
+
+                    elif response.status == 500:
+                        self.log(f"⚠️ Ошибка сервера (500), переключение ключа", "warning")
+                        outcome = "server_error"
+                        continue
+
+                    else:
+                        text = await response.text()
+                        self.log(f"❌ Ошибка {response.status}: {text[:100]}", "error")
+                        outcome = "error"
+                        await asyncio.sleep(5)
+                        continue
+
+            except asyncio.TimeoutError:
+                self.log(f"⚠️ Timeout с ключом ...{key_id}", "warning")
+                outcome = "timeout"
+                await asyncio.sleep(5)
+                continue
+
+            except aiohttp.ClientConnectionError:
+                self.log(f"⚠️ Ошибка соединения, повтор через 5 сек...", "warning")
+                outcome = "connection_error"
+                await asyncio.sleep(5)
+                continue
+
+            except Exception as e:
+                self.log(f"❌ Исключение: {str(e)}", "error")
+                outcome = "error"
+                await asyncio.sleep(5)
+                continue
+
+        self.log(f"❌ Не удалось выполнить запрос после {max_retries} попыток", "error")
+        return self.finish_request(None, "failed", lease, with_lease)
+
+    async def send_many(self, jobs):
+        """Отправить пачку запросов одновременно (не больше max_in_flight в полёте).
+
+        jobs - список dict с аргументами send_request. Результаты возвращаются
+        в том же порядке, что и jobs.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def run_one(job):
+            async with semaphore:
+                return await self.send_request(**job)
+
+        return await asyncio.gather(*(run_one(job) for job in jobs))
@@ -0,0 +1,107 @@
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Пауза, если сервер не сообщил, сколько ждать
+DEFAULT_COOLDOWN = 5.0
+
+# Сверху ограничиваем, чтобы битый заголовок не запарковал ключ навсегда
+MAX_COOLDOWN = 86400.0
+
+DURATION_PART = re.compile(r'([\d.]+)(ms|h|m|s)')
+
+
+def parse_duration(value):
+    """Длительность из заголовка Groq ('1m30s', '7.66s', '120ms', '2h5m') в секундах.
+
+    Возвращает None, если строку разобрать не удалось.
+    """
+    if value is None:
+        return None
+
+    value = str(value).strip()
+    if not value:
+        return None
+
+    # Просто число - секунды
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+
+    multipliers = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    total = 0.0
+    for number, unit in parts:
+        try:
+            total += float(number) * multipliers[unit]
+        except ValueError:
+            return None
+    return total
+
+
+def parse_retry_after(value):
+    """Retry-After: число секунд или HTTP-дата"""
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_remaining(headers, name):
+    """Значение x-ratelimit-remaining-* как int (или None)"""
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def compute_cooldown(headers, default=DEFAULT_COOLDOWN):
+    """Сколько секунд ключ должен отдыхать после 429.
+
+    Приоритет: retry-after, затем окна, которые действительно исчерпаны
+    (x-ratelimit-remaining-requests/tokens == 0 -> соответствующий reset).
+    Если сервер ничего не сообщил - default.
+    """
+    headers = headers or {}
+
+    retry_after = parse_retry_after(headers.get('retry-after'))
+    if retry_after is not None:
+        return min(retry_after, MAX_COOLDOWN)
+
+    waits = []
+
+    remaining_requests = get_remaining(headers, 'x-ratelimit-remaining-requests')
+    if remaining_requests is not None and remaining_requests <= 0:
+        reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+        if reset is not None:
+            waits.append(reset)
+
+    remaining_tokens = get_remaining(headers, 'x-ratelimit-remaining-tokens')
+    if remaining_tokens is not None and remaining_tokens <= 0:
+        reset = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+        if reset is not None:
+            waits.append(reset)
+
+    # Окно не помечено исчерпанным, но reset указан - берём ближайший
+    if not waits:
+        for name in ('x-ratelimit-reset-tokens', 'x-ratelimit-reset-requests'):
+            reset = parse_duration(headers.get(name))
+            if reset is not None:
+                waits.append(reset)
+        if waits:
+            return min(min(waits), MAX_COOLDOWN)
+        return default
+
+    return min(max(waits), MAX_COOLDOWN)
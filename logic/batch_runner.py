@@ -0,0 +1,199 @@
+import threading
+import time
+from pathlib import Path
+
+from logic.dispatcher import ConcurrentDispatcher
+from logic.job_manifest import JobManifest
+from logic.model_limits import get_fallback_chain
+from logic.rate_limiter import estimate_request_tokens
+
+
+class BatchRunner:
+    """Обработка папки чанков целиком: диспетчер, упаковка, ожидание квоты и журнал задания.
+
+    Общая часть GUI (MainWindow) и командной строки (cli.py): Tk здесь не используется,
+    прогресс отдаётся через колбэки.
+    """
+
+    def __init__(self, key_manager, api_client, processor, settings, manifest=None, logger=None):
+        self.keys = key_manager
+        self.api = api_client
+        self.processor = processor
+        self.settings = settings
+        self.manifest = manifest
+        self.logger = logger
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def settings_from_config(config):
+        """Настройки задания из config.json (для запуска без GUI)"""
+        settings = {
+            "output_folder": config.get("prompts_folder", ""),
+            "system_prompt": config.get("system_prompt", ""),
+            "model": config.get("model"),
+            "temperature": config.get("temperature", 0.7),
+            "prompts_count": config.get("prompts_count", 5),
+            "save_raw": config.get("save_raw_responses", False),
+            "delay": config.get("delay", 1),
+            "max_concurrent": config.get("max_concurrent_requests", 0),
+            "use_cache": config.get("use_response_cache", True),
+            "resume": config.get("resume_jobs", True),
+            "wait_for_capacity": config.get("wait_for_capacity", True),
+            "pack_requests": config.get("pack_requests", False),
+            "stream": config.get("stream_responses", False),
+            "use_fallback": config.get("use_model_fallback", True)
+        }
+        return settings
+
+    def prepare(self, chunks_folder):
+        """Список файлов к обработке (с учётом журнала задания) и резервные модели"""
+        settings = self.settings
+        settings["fallback_models"] = []
+        if settings.get("use_fallback"):
+            settings["fallback_models"] = get_fallback_chain(
+                settings["model"], self.get_config("model_fallbacks")
+            )[1:]
+
+        files = self.processor.get_files_to_process(chunks_folder)
+
+        if settings.get("resume") and self.manifest is None:
+            self.manifest = JobManifest(chunks_folder, settings["output_folder"], logger=self.logger)
+        if self.manifest:
+            settings["fingerprint"] = JobManifest.settings_fingerprint(
+                settings["model"], settings["system_prompt"], settings["temperature"], settings["prompts_count"]
+            )
+            files = self.manifest.filter_pending(files, settings["fingerprint"])
+        return files
+
+    def get_config(self, key, default=None):
+        """Значение из config клиента"""
+        return self.api.get_setting(key, default)
+
+    def plan_items(self, files):
+        """Элементы для диспетчера: файлы или пакеты файлов"""
+        if not self.settings.get("pack_requests"):
+            return list(files)
+
+        items = self.processor.plan_packs(
+            files,
+            max_tokens=self.get_config("pack_max_tokens", 4000),
+            max_chunks=self.get_config("pack_max_chunks", 5)
+        )
+        self.log(f"📦 Упаковка: {len(files)} чанков в {len(items)} запросов", "info")
+        return items
+
+    def estimate_tokens(self, files, models):
+        """Сколько токенов зарезервирует клиент под запрос этих файлов (как в send_request).
+
+        Резерв под ответ - наибольший среди моделей каскада, чтобы ожидание ёмкости
+        не заканчивалось раньше, чем клиент сможет получить ключ.
+        """
+        texts = [self.processor.read_chunk(file_path) or "" for file_path in files]
+        user_message = texts[0] if len(texts) == 1 else self.processor.build_packed_message(texts)
+        system_prompt = self.settings["system_prompt"].replace("{n}", str(self.settings["prompts_count"]))
+        output_tokens = max(self.keys.rate_limiter.get_output_estimate(model) for model in models)
+        return estimate_request_tokens(system_prompt, user_message, output_tokens)
+
+    def run(self, files, on_file_done=None, should_stop=None, is_paused=None, on_wait=None, on_resume=None):
+        """Обработать файлы. on_file_done(file_path, success, status, elapsed) - по каждому файлу,
+        on_wait(seconds) - все ключи на лимите (не чаще раза в секунду на все потоки),
+        on_resume() - ожидание квоты закончилось."""
+        settings = self.settings
+        should_stop = should_stop or (lambda: False)
+        dispatcher = ConcurrentDispatcher(
+            self.keys,
+            logger=self.logger,
+            max_in_flight=settings["max_concurrent"],
+            model=settings["model"]
+        )
+
+        # Открываем соединения заранее, чтобы первые запросы не платили за TLS
+        self.api.warm_up(self.keys.get_healthy_keys(settings["model"])[:dispatcher.get_in_flight_limit()])
+
+        models = [settings["model"]] + settings.get("fallback_models", [])
+
+        # Ожидание квоты сообщается из одного места: все ждущие потоки вместе - не чаще
+        # раза в секунду, конец ожидания - один раз
+        wait_lock = threading.Lock()
+        wait_state = {"reported_at": None}
+
+        def report_wait(seconds):
+            with wait_lock:
+                now = time.monotonic()
+                if wait_state["reported_at"] is not None and now - wait_state["reported_at"] < 1.0:
+                    return
+                wait_state["reported_at"] = now
+            if on_wait:
+                on_wait(seconds)
+
+        def report_resume():
+            with wait_lock:
+                if wait_state["reported_at"] is None:
+                    return
+                wait_state["reported_at"] = None
+            if on_resume:
+                on_resume()
+
+        common = dict(
+            output_folder=settings["output_folder"],
+            system_prompt=settings["system_prompt"],
+            model=settings["model"],
+            temperature=settings["temperature"],
+            prompts_count=settings["prompts_count"],
+            save_raw=settings["save_raw"],
+            use_cache=settings["use_cache"],
+            fallback_models=settings.get("fallback_models", [])
+        )
+
+        def worker(item):
+            # Элемент - файл или пакет файлов для одного запроса
+            pending = item if isinstance(item, list) else [item]
+            results = {}
+            while pending:
+                if len(pending) > 1:
+                    for file_path, success, status in self.processor.process_pack(pending, **common):
+                        results[file_path] = (success, status)
+                else:
+                    results[pending[0]] = self.processor.process_file(
+                        file_path=pending[0], stream=settings["stream"], **common
+                    )
+
+                # Все ключи на лимите - спим до ближайшего сброса и повторяем эти файлы
+                pending = [file_path for file_path in pending if results[file_path][1] == "no_keys"]
+                if not pending or not settings["wait_for_capacity"]:
+                    break
+                tokens = self.estimate_tokens(pending, models)
+                if not self.keys.wait_for_capacity(models, tokens, should_stop=should_stop, on_wait=report_wait):
+                    break
+                report_resume()
+
+            files_done = item if isinstance(item, list) else [item]
+            for file_path in files_done:
+                success, status = results[file_path]
+                if self.manifest:
+                    output_path = Path(settings["output_folder"]) / file_path.name if success else None
+                    model = self.processor.output_models.get(file_path.name, settings["model"])
+                    self.manifest.record(file_path, settings["fingerprint"], status, output_path, model)
+
+            # Задержка между запросами (если ключей <= 5) - держит слот занятым
+            if any(results[file_path][1] == "success" for file_path in files_done):
+                if len(self.keys.api_keys) <= 5 and settings["delay"] > 0:
+                    time.sleep(settings["delay"])
+
+            if isinstance(item, list):
+                return [(file_path,) + results[file_path] for file_path in files_done]
+            return results[item]
+
+        dispatcher.run(
+            self.plan_items(files),
+            worker,
+            on_file_done=on_file_done,
+            should_stop=should_stop,
+            is_paused=is_paused
+        )
@@ -0,0 +1,259 @@
+import heapq
+import time
+from datetime import datetime, timedelta
+
+from logic.rate_limiter import WINDOWS, estimate_tokens
+
+# Время одного запроса по умолчанию, сек
+DEFAULT_REQUEST_SECONDS = 3.0
+
+# Ожидание дольше этого считается исчерпанием ключа (а не обычным RPM/TPM)
+EXHAUSTED_WAIT = 120
+
+
+class SimBucket:
+    """Копия корзины TokenBucket для прогноза (время - секунды от начала прогона).
+
+    reset_at - сохранённое время сброса окна: до него корзина не пополняется,
+    в этот момент снова полная (как у сервера), дальше - обычное пополнение.
+    """
+
+    def __init__(self, capacity, rate, tokens, reset_at=None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = tokens
+        self.at = 0.0
+        self.reset_at = reset_at
+
+    def level(self, t):
+        """Единиц в корзине в момент t"""
+        if self.reset_at is not None:
+            return self.tokens if t < self.reset_at else self.capacity
+        return min(self.capacity, self.tokens + (t - self.at) * self.rate)
+
+    def time_until(self, amount, t):
+        """Момент >= t, когда в корзине будет amount единиц"""
+        amount = min(amount, self.capacity)
+        tokens = self.level(t)
+        if tokens >= amount:
+            return t
+        if self.reset_at is not None:
+            return self.reset_at
+        return t + (amount - tokens) / self.rate
+
+    def consume(self, amount, t):
+        """Списать amount единиц в момент t"""
+        self.tokens = self.level(t) - min(amount, self.capacity)
+        if self.reset_at is not None and t >= self.reset_at:
+            self.reset_at = None
+        self.at = t
+
+
+class CapacityPlanner:
+    """Прогноз прогона по папке чанков до старта (dry run, без запросов к API).
+
+    Токены каждого чанка считаются той же оценкой, что резервирует клиент
+    (estimate_tokens и get_output_estimate из rate_limiter). Дальше прогон проигрывается на копиях
+    корзин RPM/TPM/RPD/TPD валидных ключей (с сохранённым расходом): так видно общее время, какие ключи
+    упрутся в суточные лимиты и когда.
+    """
+
+    def __init__(self, key_manager, model, system_prompt, prompts_count, max_concurrent=0, logger=None):
+        self.key_manager = key_manager
+        self.model = model
+        self.system_prompt = system_prompt.replace("{n}", str(prompts_count))
+        self.prompts_count = prompts_count
+        self.max_concurrent = max_concurrent
+        self.logger = logger
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def estimate_output_tokens(self):
+        """Резерв под ответ - как у клиента"""
+        return self.key_manager.rate_limiter.get_output_estimate(self.model)
+
+    def estimate_request_seconds(self):
+        """Среднее время запроса к модели по статистике ключей"""
+        samples = []
+        with self.key_manager.state_lock:
+            for data in self.key_manager.keys_limits.values():
+                model_data = data.get('models', {}).get(self.model, {})
+                if model_data.get('avg_total_time'):
+                    samples.append(model_data['avg_total_time'])
+                elif data.get('avg_latency'):
+                    samples.append(data['avg_latency'])
+        return sum(samples) / len(samples) if samples else DEFAULT_REQUEST_SECONDS
+
+    def estimate_chunks(self, files):
+        """Токены по каждому чанку: [(файл, вход, выход)]"""
+        system_tokens = estimate_tokens(self.system_prompt)
+        output_tokens = self.estimate_output_tokens()
+        chunks = []
+        for file_path in files:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            chunks.append((file_path, system_tokens + estimate_tokens(text), output_tokens))
+        return chunks
+
+    def snapshot_keys(self):
+        """Копии корзин и пауз всех валидных ключей (и тех, что сейчас на лимите).
+
+        Корзины процесса в новом запуске полные, поэтому окна с известным расходом
+        берутся из сохранённой статистики ключа: requests_* - суточное окно (RPD),
+        tokens_* - минутное (TPM), как в заголовках x-ratelimit-*. Ёмкость такого окна
+        возвращается в момент его reset_at.
+        """
+        limiter = self.key_manager.rate_limiter
+        keys = {}
+        now = time.monotonic()
+        wall_now = datetime.now()
+        with self.key_manager.state_lock:
+            for key in self.key_manager.api_keys:
+                key_id = key[-8:]
+                status, _ = self.key_manager.get_key_status(key_id, self.model, wall_now)
+                if status == "invalid":
+                    continue
+                with limiter.lock:
+                    buckets = limiter.get_buckets(key_id, self.model)
+                    sim = {}
+                    for name, bucket in buckets.items():
+                        bucket.refill(now)
+                        sim[name] = SimBucket(bucket.capacity, bucket.rate, bucket.tokens)
+
+                model_data = self.key_manager.keys_limits.get(key_id, {}).get('models', {}).get(self.model, {})
+                for window, name in (("requests", "rpd"), ("tokens", "tpm")):
+                    seeded = self.seed_bucket(sim[name], model_data, window, wall_now)
+                    if seeded:
+                        sim[name] = seeded
+
+                keys[key_id] = {
+                    "buckets": sim,
+                    "ready_at": self.key_manager.get_cooldown(key_id, self.model, now)
+                }
+        return keys
+
+    @staticmethod
+    def seed_bucket(bucket, model_data, window, now):
+        """Корзина по сохранённому расходу окна (None - нет данных или окно уже сброшено)"""
+        limit = model_data.get(f'{window}_limit')
+        if not limit:
+            return None
+        try:
+            reset_at = datetime.fromisoformat(model_data.get(f'{window}_reset_at') or '')
+        except ValueError:
+            return None
+        seconds = (reset_at - now).total_seconds()
+        if seconds <= 0:
+            return None
+        remaining = max(0, limit - model_data.get(f'{window}_used', 0))
+        return SimBucket(float(limit), bucket.rate, min(bucket.tokens, float(remaining)), reset_at=seconds)
+
+    def plan(self, files):
+        """Прогноз: dict с токенами, временем, исчерпанием ключей и узким местом"""
+        chunks = self.estimate_chunks(files)
+        keys = self.snapshot_keys()
+        request_seconds = self.estimate_request_seconds()
+
+        report = {
+            "model": self.model,
+            "chunks": len(chunks),
+            "input_tokens": sum(chunk[1] for chunk in chunks),
+            "output_tokens": sum(chunk[2] for chunk in chunks),
+            "keys": len(keys),
+            "request_seconds": request_seconds,
+            "total_seconds": None,
+            "finish_at": None,
+            "exhausted": [],
+            "waits": {name: 0.0 for name in WINDOWS}
+        }
+        if not chunks or not keys:
+            return report
+
+        # Слоты параллельной обработки, как в ConcurrentDispatcher
+        slots_count = len(keys)
+        if self.max_concurrent and self.max_concurrent > 0:
+            slots_count = min(self.max_concurrent, slots_count)
+        slots = [0.0] * slots_count
+
+        exhausted = {}
+        finish = 0.0
+        for _, tokens_in, tokens_out in chunks:
+            start = heapq.heappop(slots)
+            amounts = {"rpm": 1, "rpd": 1, "tpm": tokens_in + tokens_out, "tpd": tokens_in + tokens_out}
+
+            # Ключ, который освободится раньше всех (как KeySelector)
+            best_id, best_at, best_window = None, None, None
+            for key_id, state in keys.items():
+                ready = max(start, state["ready_at"])
+                window = None
+                for name, bucket in state["buckets"].items():
+                    at = bucket.time_until(amounts[name], ready)
+                    if at > ready:
+                        ready, window = at, name
+                if best_at is None or ready < best_at:
+                    best_id, best_at, best_window = key_id, ready, window
+
+            if best_window:
+                report["waits"][best_window] += best_at - start
+            buckets = keys[best_id]["buckets"]
+            for name, bucket in buckets.items():
+                bucket.consume(amounts[name], best_at)
+            keys[best_id]["ready_at"] = best_at
+
+            # Суточное окно ключа больше не пропустит такой же запрос в ближайшее время
+            if best_id not in exhausted:
+                for name in ("rpd", "tpd"):
+                    if buckets[name].time_until(amounts[name], best_at) - best_at > EXHAUSTED_WAIT:
+                        exhausted[best_id] = (name, best_at)
+                        break
+
+            done = best_at + request_seconds
+            finish = max(finish, done)
+            heapq.heappush(slots, done)
+
+        now = datetime.now()
+        report["total_seconds"] = finish
+        report["finish_at"] = now + timedelta(seconds=finish)
+        report["exhausted"] = sorted(
+            (
+                {"key_id": key_id, "window": name, "seconds": at, "at": now + timedelta(seconds=at)}
+                for key_id, (name, at) in exhausted.items()
+            ),
+            key=lambda item: item["seconds"]
+        )
+        return report
+
+    def format_report(self, report):
+        """Текст прогноза для лога"""
+        lines = [
+            f"📐 Прогноз для {report['model']}: чанков {report['chunks']}, ключей {report['keys']}",
+            f"🔢 Токены: вход ~{report['input_tokens']:,}, выход ~{report['output_tokens']:,}"
+        ]
+        if report["total_seconds"] is None:
+            lines.append("⚠️ Нет чанков или доступных ключей для этой модели")
+            return "\n".join(lines)
+
+        total = int(report["total_seconds"])
+        lines.append(
+            f"⏱️ Время: ~{total // 3600}ч {total % 3600 // 60}м {total % 60}с "
+            f"(до {report['finish_at'].strftime('%d.%m %H:%M')}, запрос ~{report['request_seconds']:.1f} с)"
+        )
+
+        bottleneck = max(report["waits"], key=report["waits"].get)
+        if report["waits"][bottleneck] > 0:
+            lines.append(f"🚧 Узкое место: {bottleneck.upper()} (ожидание ~{int(report['waits'][bottleneck])} с)")
+
+        for item in report["exhausted"]:
+            lines.append(
+                f"🔴 Ключ ...{item['key_id']} исчерпает {item['window'].upper()} "
+                f"через ~{int(item['seconds']) // 60}м ({item['at'].strftime('%d.%m %H:%M')})"
+            )
+        return "\n".join(lines)
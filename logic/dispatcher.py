@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class ConcurrentDispatcher:
+    """Параллельная раздача файлов по здоровым ключам с ограничением числа запросов в полёте"""
+
+    def __init__(self, key_manager, logger=None, max_in_flight=0, model=None):
+        self.key_manager = key_manager
+        self.logger = logger
+        # 0 = автоматически (по числу здоровых ключей)
+        self.max_in_flight = max_in_flight
+        # Здоровье ключей считается по лимитам этой модели
+        self.model = model
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def get_in_flight_limit(self):
+        """Сколько файлов можно обрабатывать одновременно"""
+        healthy = len(self.key_manager.get_healthy_keys(self.model))
+        if healthy == 0:
+            return 1
+
+        if self.max_in_flight and self.max_in_flight > 0:
+            return max(1, min(self.max_in_flight, healthy))
+        return healthy
+
+    def run(self, files, worker, on_file_done=None, should_stop=None, is_paused=None):
+        """Обработка списка файлов.
+
+        Файлы запускаются строго в исходном порядке, одновременно в работе не больше
+        get_in_flight_limit() штук. worker(file_path) -> (success, status).
+        Элемент files может быть списком файлов (пакет в одном запросе) - тогда
+        worker возвращает [(file_path, success, status)] по каждому файлу пакета.
+        on_file_done(file_path, success, status, elapsed) вызывается из потока,
+        запустившего run(), в исходном порядке файлов: результат, завершившийся раньше
+        предыдущих, ждёт их (лог и прогресс не перемешиваются).
+        Пауза перестаёт выдавать новые файлы, стоп - дожидается файлов в полёте и выходит.
+        """
+        should_stop = should_stop or (lambda: False)
+        is_paused = is_paused or (lambda: False)
+
+        pending = list(files)
+        next_index = 0
+        in_flight = {}
+        processed = 0
+        # Готовые результаты по номеру элемента, ещё не отданные в on_file_done
+        finished = {}
+        next_report = 0
+
+        # Пул - под наибольший возможный limit (потоки создаются по мере надобности):
+        # если на старте все ключи на лимите, параллельность вырастет после сброса
+        max_workers = self.max_in_flight
+        if not max_workers or max_workers <= 0:
+            max_workers = len(self.key_manager.api_keys)
+        max_workers = max(1, min(max_workers, len(pending)))
+
+        limit = min(self.get_in_flight_limit(), max_workers)
+        self.log(f"🔀 Параллельных запросов: {limit}", "info")
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="groq-worker") as executor:
+            while next_index < len(pending) or in_flight:
+                stopping = should_stop()
+
+                # Число здоровых ключей могло измениться (лимиты, сбросы, новые ключи)
+                new_limit = min(self.get_in_flight_limit(), max_workers)
+                if new_limit != limit:
+                    self.log(f"🔀 Параллельных запросов: {new_limit}", "info")
+                    limit = new_limit
+
+                # Выдаём новые файлы, пока есть свободные слоты
+                while (not stopping and not is_paused()
+                       and next_index < len(pending) and len(in_flight) < limit):
+                    file_path = pending[next_index]
+                    future = executor.submit(self._run_one, worker, file_path)
+                    in_flight[future] = next_index
+                    next_index += 1
+
+                if not in_flight:
+                    if stopping:
+                        break
+                    # Пауза (или ждём освобождения ключей)
+                    time.sleep(0.5)
+                    continue
+
+                done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    finished[in_flight.pop(future)] = future.result()
+
+                # Отдаём результаты подряд, начиная с самого раннего неотданного
+                while next_report in finished:
+                    for file_path, success, status, elapsed in finished.pop(next_report):
+                        processed += 1
+                        if on_file_done:
+                            on_file_done(file_path, success, status, elapsed)
+                    next_report += 1
+
+        return processed
+
+    def _run_one(self, worker, item):
+        """Обработка одного файла (или пакета) в рабочем потоке: [(file_path, success, status, elapsed)]"""
+        start = time.time()
+        files = item if isinstance(item, list) else [item]
+        try:
+            result = worker(item)
+            results = result if isinstance(result, list) else [(item,) + tuple(result)]
+        except Exception as e:
+            self.log(f"❌ Исключение при обработке {files[0].name}: {str(e)}", "error")
+            results = [(file_path, False, "exception") for file_path in files]
+
+        # Время пакета делится поровну между его файлами
+        elapsed = (time.time() - start) / max(1, len(results))
+        return [(file_path, success, status, elapsed) for file_path, success, status in results]
@@ -1,13 +1,37 @@
 import os
+import re
+import threading
 from pathlib import Path
 from datetime import datetime
 
+from logic.rate_limiter import estimate_tokens
+
+# Заголовок раздела чанка в упакованном запросе и ответе
+PACK_HEADER = "### CHUNK {index} ###"
+PACK_HEADER_PATTERN = re.compile(r"^[\W_]*CHUNK\s+(\d+)[\W_]*$", re.IGNORECASE | re.MULTILINE)
+
+# Пронумерованный пункт списка в ответе (1. / 2) / 3:) - по ним считается, когда промптов достаточно
+NUMBERED_LINE_PATTERN = re.compile(r"^\s*\d+\s*[.):]")
+
+# Инструкция модели для упакованного запроса
+PACK_INSTRUCTION = (
+    "The text below contains {count} separate chunks. Process EACH chunk independently "
+    "according to the instructions. Answer for each chunk under its own header line, exactly like "
+    "\"" + PACK_HEADER.format(index=1) + "\", keeping the same numbers and order, "
+    "and write nothing outside these sections."
+)
+
 class FileProcessor:
     """Обработка файлов с чанками и промптами"""
     
-    def __init__(self, api_client, logger=None):
+    def __init__(self, api_client, logger=None, response_cache=None):
         self.api_client = api_client
         self.logger = logger
+        # Кэш ответов на диске (ResponseCache), None - без кэша
+        self.response_cache = response_cache
+        # Какая модель дала выход файла (при переходе на резервную модель)
+        self.output_models = {}
+        self.tag_lock = threading.Lock()
     
     def log(self, message, level="info"):
         """Вывод в лог"""
@@ -31,23 +55,30 @@ class FileProcessor:
         prompts = []
         
         for line in response_text.split('\n'):
-            line = line.strip()
-            
-            # Фильтр: минимум 20 символов
-            if len(line) > 20:
-                # Удаляем нумерацию в начале (1., 2), №1, etc)
-                if line[0].isdigit():
-                    # Ищем точку или скобку после цифры
-                    for i, char in enumerate(line):
-                        if char in '.):':
-                            line = line[i+1:].strip()
-                            break
-                
-                if line:
-                    prompts.append(line)
+            prompt = self.parse_prompt_line(line)
+            if prompt:
+                prompts.append(prompt)
         
         return prompts
     
+    def parse_prompt_line(self, line):
+        """Промпт из одной строки ответа (None - строка не промпт)"""
+        line = line.strip()
+        
+        # Фильтр: минимум 20 символов
+        if len(line) <= 20:
+            return None
+        
+        # Удаляем нумерацию в начале (1., 2), №1, etc)
+        if line[0].isdigit():
+            # Ищем точку или скобку после цифры
+            for i, char in enumerate(line):
+                if char in '.):':
+                    line = line[i+1:].strip()
+                    break
+        
+        return line or None
+    
     def save_prompts(self, prompts, output_path):
         """Сохранение промптов в файл"""
         try:
@@ -59,6 +90,17 @@ class FileProcessor:
             self.log(f"❌ Ошибка сохранения: {str(e)}", "error")
             return False
     
+    def tag_output(self, output_path, model):
+        """Отметить модель, которая дала выходной файл (models.tsv в папке промптов)"""
+        output_path = Path(output_path)
+        self.output_models[output_path.name] = model
+        try:
+            with self.tag_lock:
+                with open(output_path.parent / "models.tsv", 'a', encoding='utf-8') as f:
+                    f.write(f"{output_path.name}\t{model}\n")
+        except OSError as e:
+            self.log(f"⚠️ Не удалось записать модель для {output_path.name}: {str(e)}", "warning")
+    
     def save_raw_response(self, response_text, filename):
         """Сохранение сырого ответа API для отладки"""
         try:
@@ -73,8 +115,47 @@ class FileProcessor:
         except:
             return False
 
-    def process_file(self, file_path, output_folder, system_prompt, model, temperature, prompts_count, save_raw=False):
-        """Обработка одного файла с чанком"""
+    def get_cached_prompts(self, cache_key, file_path):
+        """Промпты из кэша ответов (None - промах)"""
+        response = self.response_cache.get(cache_key)
+        if not response:
+            return None
+        
+        prompts = self.parse_prompts(response)
+        if not prompts:
+            return None
+        
+        self.log(f"💾 Ответ из кэша: {file_path.name}", "info")
+        return prompts
+    
+    def try_cache(self, file_path, chunk_text, output_folder, system_prompt_formatted, model, temperature, prompts_count,
+                  use_cache=True):
+        """Ответ из кэша: (cache_key, результат) - результат None при промахе"""
+        if not use_cache or not self.response_cache:
+            return None, None
+        
+        cache_key = self.response_cache.make_key(
+            model, system_prompt_formatted, chunk_text, temperature, prompts_count
+        )
+        prompts = self.get_cached_prompts(cache_key, file_path)
+        if not prompts:
+            return cache_key, None
+        
+        output_path = Path(output_folder) / file_path.name
+        if not self.save_prompts(prompts, output_path):
+            return cache_key, (False, "save_error")
+        self.tag_output(output_path, model)
+        self.log(f"✅ Сохранено {len(prompts)} промптов → {output_path.name}", "success")
+        return cache_key, (True, "cached")
+    
+    def process_file(self, file_path, output_folder, system_prompt, model, temperature, prompts_count, save_raw=False, use_cache=True,
+                     fallback_models=None, stream=False):
+        """Обработка одного файла с чанком.
+
+        fallback_models - резервные модели на случай, когда квота model исчерпана у всех ключей.
+        stream=True - ответ читается потоком, промпты пишутся в файл по мере готовности,
+        генерация обрывается, как только получено prompts_count промптов.
+        """
         
         # Чтение чанка
         chunk_text = self.read_chunk(file_path)
@@ -84,28 +165,63 @@ class FileProcessor:
         # Подстановка {n} в system prompt
         system_prompt_formatted = system_prompt.replace("{n}", str(prompts_count))
         
+        # Кэш ответов: неизменённый чанк с теми же настройками не отправляем повторно
+        cache_key, cached = self.try_cache(
+            file_path, chunk_text, output_folder, system_prompt_formatted, model, temperature, prompts_count, use_cache
+        )
+        if cached:
+            return cached
+        
         # Отправка запроса к API
         self.log(f"🔄 Обработка: {file_path.name}", "info")
-        response, status = self.api_client.send_request(
+        prompt_stream = None
+        if stream:
+            prompt_stream = PromptStream(self, Path(output_folder) / file_path.name, prompts_count)
+        
+        response, status, lease, used_model = self.api_client.send_request_cascade(
             user_message=chunk_text,
             system_prompt=system_prompt_formatted,
-            model=model,
-            temperature=temperature
+            models=[model] + list(fallback_models or []),
+            temperature=temperature,
+            stream=prompt_stream
         )
+        if prompt_stream:
+            if status == "success":
+                # Разобранные на лету промпты (без оборванной последней строки)
+                response = "\n".join(prompt_stream.prompts)
+                prompt_stream.commit()
+            else:
+                prompt_stream.close()
+                prompt_stream.discard()
+        
+        # Ответ резервной модели кэшируется под её собственным ключом
+        if cache_key and used_model != model:
+            cache_key = self.response_cache.make_key(
+                used_model, system_prompt_formatted, chunk_text, temperature, prompts_count
+            )
         
-        if status != "success" or not response:
+        # Счётчики пишутся в ключ, который реально обслужил запрос
+        try:
+            status = self.handle_response(
+                response, status, lease, file_path, output_folder, used_model, save_raw, cache_key
+            )
+        finally:
+            if lease:
+                lease.release(status)
+        
+        return status == "success", status
+    
+    def handle_response(self, response, status, lease, file_path, output_folder, model, save_raw, cache_key):
+        """Разбор ответа API и сохранение промптов, возвращает статус файла"""
+        if status == "success" and not response:
+            # Пустой ответ (или поток без единой строки промптов) - файл не обработан
+            self.log(f"⚠️ Пустой ответ для {file_path.name}", "warning")
+            status = "empty_response"
+        if status != "success":
             # ✅ НОВОЕ: Регистрируем ошибку
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                # Получаем текущий использованный ключ
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
-            
-            return False, status
+            if lease:
+                lease.add_error()
+            return status
         
         # Сохранение сырого ответа (если включено)
         if save_raw:
@@ -118,48 +234,171 @@ class FileProcessor:
             self.log(f"⚠️ Не удалось распарсить промпты из {file_path.name}", "warning")
             
             # ✅ НОВОЕ: Регистрируем ошибку парсинга
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
-            
-            return False, "parse_error"
+            lease.add_error()
+            return "parse_error"
+        
+        if cache_key:
+            self.response_cache.put(cache_key, response, model)
         
         # Сохранение промптов
         output_path = Path(output_folder) / file_path.name
-        success = self.save_prompts(prompts, output_path)
         
-        if success:
+        if self.save_prompts(prompts, output_path):
             # ✅ НОВОЕ: Регистрируем успешную обработку
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_file_processed(api_key)
-                    self.api_client.key_manager.add_prompts_generated(api_key, len(prompts))
+            lease.add_file_processed()
+            lease.add_prompts(len(prompts))
+            self.tag_output(output_path, model)
             
-            self.log(f"✅ Сохранено {len(prompts)} промптов → {output_path.name}", "success")
-            return True, "success"
-        else:
-            # ✅ НОВОЕ: Регистрируем ошибку сохранения
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
+            self.log(f"✅ Сохранено {len(prompts)} промптов → {output_path.name} [{model}]", "success")
+            return "success"
+        
+        # ✅ НОВОЕ: Регистрируем ошибку сохранения
+        lease.add_error()
+        return "save_error"
+
+    def plan_packs(self, files, max_tokens=4000, max_chunks=5):
+        """Группы соседних чанков для упакованных запросов (не больше max_tokens входа и max_chunks штук)"""
+        packs = []
+        pack = []
+        pack_tokens = 0
+        for file_path in files:
+            try:
+                tokens = estimate_tokens(file_path.read_text(encoding='utf-8'))
+            except (OSError, UnicodeDecodeError):
+                tokens = max_tokens
             
-            return False, "save_error"
+            if pack and (pack_tokens + tokens > max_tokens or len(pack) >= max_chunks):
+                packs.append(pack)
+                pack, pack_tokens = [], 0
+            pack.append(file_path)
+            pack_tokens += tokens
+        
+        if pack:
+            packs.append(pack)
+        return packs
+    
+    def build_packed_message(self, chunk_texts):
+        """Несколько чанков в одном сообщении с пронумерованными разделами"""
+        parts = [PACK_INSTRUCTION.format(count=len(chunk_texts))]
+        for index, text in enumerate(chunk_texts, 1):
+            parts.append(f"{PACK_HEADER.format(index=index)}\n{text}")
+        return "\n\n".join(parts)
+    
+    def split_packed_response(self, response_text, count):
+        """Разделы ответа по номерам чанков; None - ответ разбит неправильно"""
+        headers = list(PACK_HEADER_PATTERN.finditer(response_text))
+        sections = {}
+        for i, match in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(response_text)
+            index = int(match.group(1))
+            if index in sections:
+                return None
+            sections[index] = response_text[match.end():end].strip()
+        
+        if sorted(sections) != list(range(1, count + 1)):
+            return None
+        return [sections[index] for index in range(1, count + 1)]
+    
+    def process_pack(self, file_paths, output_folder, system_prompt, model, temperature, prompts_count, save_raw=False,
+                     use_cache=True, fallback_models=None):
+        """Несколько чанков одним запросом.
 
+        Ответ делится обратно по заголовкам разделов; если раздел потерян, продублирован
+        или пуст - каждый чанк отправляется отдельным запросом (process_file).
+        Возвращает [(file_path, success, status)].
+        """
+        common = dict(
+            output_folder=output_folder, system_prompt=system_prompt, model=model, temperature=temperature,
+            prompts_count=prompts_count, save_raw=save_raw, use_cache=use_cache, fallback_models=fallback_models
+        )
+        system_prompt_formatted = system_prompt.replace("{n}", str(prompts_count))
+        
+        # Кэш и ошибки чтения - сразу, в пакет идут только чанки, которые нужно отправить
+        results = {}
+        packed = []
+        for file_path in file_paths:
+            chunk_text = self.read_chunk(file_path)
+            if not chunk_text:
+                results[file_path] = (False, "read_error")
+                continue
+            _, cached = self.try_cache(
+                file_path, chunk_text, output_folder, system_prompt_formatted, model, temperature, prompts_count, use_cache
+            )
+            if cached:
+                results[file_path] = cached
+            else:
+                packed.append((file_path, chunk_text))
+        
+        if len(packed) == 1:
+            file_path = packed[0][0]
+            results[file_path] = self.process_file(file_path, **common)
+        elif packed:
+            for file_path, success, status in self.send_pack(packed, output_folder, system_prompt_formatted, model,
+                                                             temperature, prompts_count, save_raw, use_cache,
+                                                             fallback_models):
+                if status == "mis_split":
+                    success, status = self.process_file(file_path, **common)
+                results[file_path] = (success, status)
+        
+        return [(file_path,) + results[file_path] for file_path in file_paths]
+    
+    def send_pack(self, packed, output_folder, system_prompt_formatted, model, temperature, prompts_count, save_raw,
+                  use_cache, fallback_models):
+        """Отправка пакета и раскладка ответа по файлам: [(file_path, success, status)]"""
+        names = ", ".join(file_path.name for file_path, _ in packed)
+        self.log(f"📦 Пакет из {len(packed)} чанков: {names}", "info")
+        
+        response, status, lease, used_model = self.api_client.send_request_cascade(
+            user_message=self.build_packed_message([text for _, text in packed]),
+            system_prompt=system_prompt_formatted,
+            models=[model] + list(fallback_models or []),
+            temperature=temperature
+        )
+        
+        results = []
+        try:
+            if status == "success" and not response:
+                status = "empty_response"
+            if status != "success":
+                if lease:
+                    lease.add_error()
+                return [(file_path, False, status) for file_path, _ in packed]
+            
+            if save_raw:
+                self.save_raw_response(response, "pack_" + packed[0][0].stem)
+            
+            sections = self.split_packed_response(response, len(packed))
+            section_prompts = [self.parse_prompts(section) for section in sections] if sections else []
+            if not sections or not all(section_prompts):
+                self.log(f"⚠️ Ответ на пакет разбит неверно - чанки будут отправлены по одному", "warning")
+                lease.add_error()
+                status = "mis_split"
+                return [(file_path, False, "mis_split") for file_path, _ in packed]
+            
+            for (file_path, chunk_text), section, prompts in zip(packed, sections, section_prompts):
+                # Раздел кэшируется как ответ на одиночный чанк
+                if use_cache and self.response_cache:
+                    cache_key = self.response_cache.make_key(
+                        used_model, system_prompt_formatted, chunk_text, temperature, prompts_count
+                    )
+                    self.response_cache.put(cache_key, section, used_model)
+                
+                output_path = Path(output_folder) / file_path.name
+                if not self.save_prompts(prompts, output_path):
+                    lease.add_error()
+                    results.append((file_path, False, "save_error"))
+                    continue
+                
+                lease.add_file_processed()
+                lease.add_prompts(len(prompts))
+                self.tag_output(output_path, used_model)
+                self.log(f"✅ Сохранено {len(prompts)} промптов → {output_path.name} [{used_model}]", "success")
+                results.append((file_path, True, "success"))
+            return results
+        finally:
+            if lease:
+                lease.release(status)
+    
     def get_files_to_process(self, chunks_folder):
         """Получить список .txt файлов для обработки"""
         chunks_path = Path(chunks_folder)
@@ -183,3 +422,76 @@ class FileProcessor:
         
         # Нужно спросить пользователя (это сделает GUI)
         return None, None
+
+
+class PromptStream:
+    """Приёмник потокового ответа: разбирает строки по мере прихода и сразу дописывает промпты в файл.
+
+    Промпты пишутся во временный <файл>.part, выходной файл заменяется им только
+    после успешного ответа - оборванный поток не портит результат прошлого запуска.
+    """
+    
+    def __init__(self, processor, output_path, prompts_count=0):
+        self.processor = processor
+        self.output_path = Path(output_path)
+        self.part_path = self.output_path.with_name(self.output_path.name + ".part")
+        # 0 - читать ответ до конца
+        self.prompts_count = prompts_count
+        self.prompts = []
+        # Пронумерованных промптов: вступление модели ("Here are 5 prompts...") в счёт не идёт
+        self.numbered = 0
+        self.file = None
+        # Временный файл начат этим ответом
+        self.written = False
+    
+    def reset(self):
+        """Начало нового ответа (повтор с другим ключом) - сбрасываем уже записанное"""
+        self.close()
+        self.discard()
+        self.prompts = []
+        self.numbered = 0
+    
+    def feed_line(self, line):
+        """Строка ответа. Возвращает False, когда промптов достаточно"""
+        prompt = self.processor.parse_prompt_line(line)
+        if prompt:
+            if self.file is None:
+                self.file = open(self.part_path, 'w', encoding='utf-8')
+                self.written = True
+            self.file.write(prompt + '\n')
+            self.file.flush()
+            self.prompts.append(prompt)
+            if NUMBERED_LINE_PATTERN.match(line):
+                self.numbered += 1
+        
+        # Останавливаемся только по явному счёту пронумерованных пунктов;
+        # ответ без нумерации читается до конца
+        return not (self.prompts_count and self.numbered >= self.prompts_count)
+    
+    def close(self):
+        """Закрыть файл"""
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    def commit(self):
+        """Ответ получен целиком - временный файл заменяет выходной"""
+        self.close()
+        if not self.written:
+            return
+        try:
+            os.replace(self.part_path, self.output_path)
+            self.written = False
+        except OSError:
+            # Выходной файл всё равно запишет handle_response
+            self.discard()
+    
+    def discard(self):
+        """Удалить частично записанный временный файл (выходной файл не трогаем)"""
+        if not self.written:
+            return
+        self.written = False
+        try:
+            self.part_path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    """Пул keep-alive HTTP-сессий: TCP+TLS соединения переиспользуются между запросами"""
+
+    def __init__(self, per_key=False, pool_size=32, idle_timeout=300, logger=None):
+        # per_key=True - отдельная сессия (и пул соединений) на каждый ключ,
+        # иначе одна общая сессия на все ключи
+        self.per_key = per_key
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+        self.sessions = {}
+        self.last_used = {}
+        self.lock = threading.Lock()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def create_session(self):
+        """Новая сессия с пулом соединений нужного размера"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_session(self, api_key=None):
+        """Сессия для ключа (или общая)"""
+        pool_id = api_key[-8:] if (self.per_key and api_key) else "shared"
+        now = time.monotonic()
+
+        with self.lock:
+            self._evict_idle(now)
+
+            session = self.sessions.get(pool_id)
+            if session is None:
+                session = self.create_session()
+                self.sessions[pool_id] = session
+            self.last_used[pool_id] = now
+            return session
+
+    def _evict_idle(self, now):
+        """Закрыть сессии, которые не использовались дольше idle_timeout (под lock)"""
+        if not self.idle_timeout:
+            return
+
+        for pool_id in list(self.sessions):
+            if now - self.last_used.get(pool_id, now) > self.idle_timeout:
+                self.sessions.pop(pool_id).close()
+                self.last_used.pop(pool_id, None)
+
+    def evict_idle(self):
+        """Принудительная очистка простаивающих сессий"""
+        with self.lock:
+            self._evict_idle(time.monotonic())
+
+    def post(self, api_key, url, **kwargs):
+        """POST через пул"""
+        return self.get_session(api_key).post(url, **kwargs)
+
+    def get(self, api_key, url, **kwargs):
+        """GET через пул"""
+        return self.get_session(api_key).get(url, **kwargs)
+
+    def warm_up(self, api_keys, url, connections=1):
+        """Заранее открыть соединения (TLS-рукопожатие до начала обработки).
+
+        Для общей сессии открывается connections соединений на весь пул,
+        для per_key - по одному на каждый ключ.
+        """
+        if self.per_key:
+            targets = list(api_keys)
+        else:
+            targets = [api_keys[0] if api_keys else None] * max(1, connections)
+
+        if not targets:
+            return 0
+
+        def touch(api_key):
+            try:
+                self.get_session(api_key).head(url, timeout=10)
+                return True
+            except requests.exceptions.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=min(len(targets), self.pool_size)) as executor:
+            opened = sum(executor.map(touch, targets))
+
+        self.log(f"🔌 Прогрев соединений: {opened}/{len(targets)}", "info")
+        return opened
+
+    def close(self):
+        """Закрыть все сессии"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            self.last_used.clear()
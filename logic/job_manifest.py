@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Статусы, после которых чанк повторно не обрабатывается
+DONE_STATUSES = ("success", "cached")
+
+
+class JobManifest:
+    """Журнал задания: по каждому чанку хранит хэш текста, отпечаток настроек, статус и выходной файл.
+
+    Журнал - JSONL (одна запись на строку, дописывается после каждого файла),
+    поэтому падение или Стоп теряют максимум одну недописанную строку.
+    """
+
+    def __init__(self, chunks_folder, output_folder, journal_dir="logs/jobs", logger=None):
+        self.chunks_folder = str(Path(chunks_folder).resolve())
+        self.output_folder = str(Path(output_folder).resolve())
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.content_hashes = {}
+
+        job_id = hashlib.sha1(f"{self.chunks_folder}|{self.output_folder}".encode('utf-8')).hexdigest()[:16]
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = Path(journal_dir) / f"{job_id}.jsonl"
+
+        self.load()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def settings_fingerprint(model, system_prompt, temperature, prompts_count):
+        """Отпечаток настроек, влияющих на результат"""
+        payload = json.dumps([model, system_prompt, float(temperature), int(prompts_count)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def hash_file(file_path):
+        """Хэш содержимого чанка"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load(self):
+        """Чтение журнала (последняя запись по файлу побеждает)"""
+        if not self.path.exists():
+            return
+
+        lines = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописанная строка после падения
+                    continue
+                self.entries[entry['file']] = entry
+
+        # Журнал сильно разросся - переписываем только актуальные записи
+        if lines > 2 * len(self.entries) + 100:
+            self.compact()
+
+    def compact(self):
+        """Атомарная перезапись журнала без устаревших записей"""
+        with self.lock:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+    def is_done(self, file_path, fingerprint):
+        """Чанк уже обработан с теми же текстом и настройками, и выход на месте"""
+        entry = self.entries.get(file_path.name)
+        if not entry or entry.get('status') not in DONE_STATUSES:
+            return False
+        if entry.get('fingerprint') != fingerprint:
+            return False
+        if not entry.get('output') or not Path(entry['output']).exists():
+            return False
+
+        try:
+            content_hash = self.hash_file(file_path)
+        except OSError:
+            return False
+        self.content_hashes[file_path.name] = content_hash
+        return entry.get('content_hash') == content_hash
+
+    def filter_pending(self, files, fingerprint):
+        """Оставить только новые, изменённые и недообработанные чанки"""
+        pending = [file_path for file_path in files if not self.is_done(file_path, fingerprint)]
+        skipped = len(files) - len(pending)
+        if skipped:
+            self.log(f"⏭️ Пропущено уже обработанных чанков: {skipped}", "info")
+        return pending
+
+    def record(self, file_path, fingerprint, status, output_path=None, model=None):
+        """Записать результат обработки чанка"""
+        content_hash = self.content_hashes.get(file_path.name)
+        if content_hash is None:
+            try:
+                content_hash = self.hash_file(file_path)
+            except OSError:
+                content_hash = None
+
+        entry = {
+            "file": file_path.name,
+            "content_hash": content_hash,
+            "fingerprint": fingerprint,
+            "status": status,
+            "output": str(output_path) if output_path else None,
+            "model": model,
+            "updated": time.time()
+        }
+
+        with self.lock:
+            self.entries[file_path.name] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
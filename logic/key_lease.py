@@ -0,0 +1,63 @@
+import time
+
+
+class KeyLease:
+    """Аренда API ключа на один запрос.
+
+    Выдаётся KeyManager'ом вместе с ключом и возвращается через release() с исходом,
+    временем ответа и расходом токенов. Все счётчики файла (промпты, ошибки,
+    обработанные файлы) пишутся через аренду - то есть в тот ключ, который
+    действительно обслужил запрос.
+    """
+
+    def __init__(self, key_manager, api_key, model=None, tokens=0):
+        self.key_manager = key_manager
+        self.api_key = api_key
+        self.key_id = api_key[-8:]
+        self.model = model
+        # Сколько токенов зарезервировано в бюджете модели
+        self.tokens = tokens
+        self.started_at = time.monotonic()
+        self.latency = None
+        self.usage = None
+        self.released = False
+
+    def record_response(self, headers, latency=None, usage=None):
+        """Ответ сервера: лимиты из заголовков, время ответа, usage"""
+        self.key_manager.update_key_limits(self.api_key, headers, self.model)
+        if latency is not None:
+            self.latency = latency
+        if usage is not None:
+            self.usage = usage
+
+    def add_prompts(self, count):
+        """Промпты, сгенерированные по этому запросу"""
+        self.key_manager.add_prompts_generated(self.api_key, count)
+
+    def add_file_processed(self):
+        """Файл успешно обработан"""
+        self.key_manager.add_file_processed(self.api_key)
+
+    def add_error(self):
+        """Ошибка обработки файла"""
+        self.key_manager.add_error(self.api_key)
+
+    def mark_invalid(self):
+        """Ключ отклонён сервером (401)"""
+        self.key_manager.mark_key_invalid(self.api_key)
+
+    def park(self, seconds):
+        """Ключ на паузе для этой модели (429)"""
+        self.key_manager.park_key(self.api_key, self.model, seconds)
+
+    def release(self, outcome, latency=None, usage=None):
+        """Вернуть ключ (повторный вызов ничего не делает)"""
+        if self.released:
+            return
+        self.released = True
+
+        if latency is None:
+            latency = self.latency
+        if usage is None:
+            usage = self.usage
+        self.key_manager.release_lease(self, outcome, latency, usage)
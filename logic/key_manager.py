@@ -1,274 +1,543 @@
-import json
 import os
 import threading
-import re
+import time
 from datetime import datetime, timedelta
-from tkinter import messagebox
+
+from logic.backoff import DEFAULT_COOLDOWN, parse_duration
+from logic.key_lease import KeyLease
+from logic.key_selector import KeySelector
+from logic.key_source import KeySourceWatcher, read_keys_file
+from logic.rate_limiter import RateScheduler
+from logic.state_store import PATH_SEPARATOR, JsonStateStore, SqliteStateStore
+from utils.desktop import show_error
+
+
+def model_counter(model, name):
+    """Путь к счётчику модели в хранилище: models|<модель>|total_requests"""
+    return PATH_SEPARATOR.join(("models", model, name))
+
 
 class KeyManager:
     """Управление API ключами (загрузка, ротация, лимиты)"""
     
-    def __init__(self, keys_file="API_keys.txt", limits_file="logs/keys_limits.json"):
+    def __init__(self, keys_file="API_keys.txt", limits_file="logs/keys_limits.json",
+                 flush_interval=2.0, flush_every=50, backend="json",
+                 logger=None, watch_interval=2.0):
         self.keys_file = keys_file
         self.limits_file = limits_file
+        self.logger = logger
         self.api_keys = []
         self.keys_limits = {}
-        self.current_key_index = 0
-        self.request_counter = 0
-        self.file_lock = threading.Lock()
+        # Защита состояния ключей при параллельной обработке
+        self.state_lock = threading.RLock()
+        self.capacity_changed = threading.Condition(self.state_lock)
+        # Бюджеты RPM/TPM/RPD/TPD по каждой паре ключ+модель
+        self.rate_limiter = RateScheduler()
+        # Пауза ключей после 429: (key_id, model) -> monotonic-дедлайн
+        self.cooldowns = {}
+        # Очередь ключей по времени готовности (O(log n) выбор)
+        self.selector = KeySelector()
+        # Расход токенов за текущий запуск: модель ("" - все) -> суммы
+        self.session_usage = {}
+        # Подписчики на изменения ключей (окно статистики): callback(key_id)
+        self.change_listeners = []
         
         # Создаём папку для логов
         os.makedirs("logs", exist_ok=True)
         
+        if backend == "sqlite":
+            # SQLite (WAL): общий пул ключей для нескольких процессов,
+            # при первом запуске импортирует keys_limits.json
+            self.store = SqliteStateStore(
+                os.path.splitext(self.limits_file)[0] + ".db",
+                import_json=self.limits_file
+            )
+        else:
+            # Отложенная запись keys_limits.json (пачками, атомарно)
+            self.store = JsonStateStore(
+                self.limits_file,
+                get_data=lambda: self.keys_limits,
+                lock=self.state_lock,
+                flush_interval=flush_interval,
+                flush_every=flush_every
+            )
+        
         # Загружаем данные
         self.load_api_keys()
         self.load_keys_limits()
+        self.rebuild_selector()
+        
+        # Файл ключей перечитывается только когда он изменился (в фоне)
+        self.key_watcher = KeySourceWatcher(self.keys_file, self.apply_api_keys, watch_interval, logger)
+        if watch_interval:
+            self.key_watcher.start()
+    
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
     
     def load_api_keys(self):
-        """Загрузка API ключей из файла"""
-        self.api_keys = []
-        if os.path.exists(self.keys_file):
-            with open(self.keys_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    key = line.strip()
-                    if key and not key.startswith('#'):
-                        self.api_keys.append(key)
+        """Загрузка API ключей из файла (при запуске)"""
+        self.api_keys = read_keys_file(self.keys_file) or []
         
         if not self.api_keys:
-            messagebox.showerror(
+            self.log(f"❌ Файл {self.keys_file} пуст или не найден! Добавьте API ключи (один на строку)", "error")
+            show_error(
                 "❌ Ошибка",
                 f"Файл {self.keys_file} пуст или не найден!\n\n"
                 "Добавьте API ключи (один на строку)"
             )
     
-    def reload_api_keys(self):
-        """Перезагрузка API ключей"""
-        old_count = len(self.api_keys)
-        self.load_api_keys()
-        new_count = len(self.api_keys)
-        return old_count, new_count
+    def apply_api_keys(self, keys):
+        """Применить новый список ключей разницей: новые ключи встают в очередь,
+        удалённые больше не выдаются (уже начатые запросы с ними завершаются),
+        лимиты, статистика и паузы оставшихся ключей сохраняются."""
+        keys = list(dict.fromkeys(keys))
+        with self.state_lock:
+            old_keys = set(self.api_keys)
+            added = [key for key in keys if key not in old_keys]
+            removed = [key for key in self.api_keys if key not in set(keys)]
+            if not added and not removed and keys == self.api_keys:
+                return False
+            
+            self.api_keys = keys
+            
+            for key in removed:
+                self.selector.remove(key)
+            for key in added:
+                if not self.keys_limits.get(key[-8:], {}).get('permanently_invalid', False):
+                    self.selector.enable(key)
+            
+            self.capacity_changed.notify_all()
+        
+        self.notify_key_changed(None)
+        self.log(f"🔑 Ключи обновлены: +{len(added)} / -{len(removed)}, всего {len(keys)}", "info")
+        return True
     
     def load_keys_limits(self):
         """Загрузка лимитов ключей из файла"""
-        if os.path.exists(self.limits_file):
-            with self.file_lock:
-                with open(self.limits_file, 'r', encoding='utf-8') as f:
-                    self.keys_limits = json.load(f)
-        else:
-            self.keys_limits = {}
-        
+        self.keys_limits = self.store.load_all()
         self.reset_expired_limits()
     
     def save_keys_limits(self):
-        """Сохранение лимитов ключей"""
-        with self.file_lock:
-            with open(self.limits_file, 'w', encoding='utf-8') as f:
-                json.dump(self.keys_limits, f, indent=2)
+        """Сохранение лимитов ключей (отложенное - см. JsonStateStore)"""
+        self.store.save_all(self.keys_limits)
+    
+    def reset_all_stats(self):
+        """Сброс всей статистики ключей"""
+        with self.state_lock:
+            self.keys_limits = {}
+            self.cooldowns.clear()
+            self.save_keys_limits()
+            self.rebuild_selector()
+        self.notify_key_changed(None)
+    
+    def save_key_limits(self, key_id, increments=None):
+        """Сохранение данных одного ключа; increments - на сколько выросли счётчики"""
+        self.store.save_key(key_id, self.keys_limits.get(key_id), increments)
+        self.notify_key_changed(key_id)
+    
+    def add_change_listener(self, callback):
+        """Подписка на изменения: callback(key_id) после изменения данных ключа,
+        callback(None) - изменился сам список ключей или всё состояние.
+        Вызывается из рабочих потоков (часто под state_lock) - callback должен
+        только запомнить изменение и сразу вернуться."""
+        self.change_listeners.append(callback)
+    
+    def notify_key_changed(self, key_id=None):
+        """Сообщить подписчикам об изменении ключа (None - всех ключей)"""
+        for callback in list(self.change_listeners):
+            try:
+                callback(key_id)
+            except Exception as e:
+                self.log(f"⚠️ Ошибка подписчика изменений ключей: {str(e)}", "warning")
+    
+    def sync_from_store(self):
+        """Подтянуть изменения, сделанные другими процессами (SQLite)"""
+        if not self.store.changed_externally():
+            return False
+        
+        # Чтение и замена под state_lock: все свои изменения к этому моменту уже
+        # записаны (save_key_limits зовётся под тем же замком) и не потеряются
+        with self.state_lock:
+            if not self.store.changed_externally():
+                return False
+            self.keys_limits = self.store.load_all()
+            self.rebuild_selector()
+        self.notify_key_changed(None)
+        return True
+    
+    def close(self):
+        """Сохранить всё при завершении программы"""
+        self.key_watcher.stop()
+        self.store.close()
     
     def reset_expired_limits(self):
-        """Сброс устаревших лимитов"""
+        """Сброс устаревших лимитов (по каждой модели ключа)"""
         now = datetime.now()
-        changed = False
+        changed_keys = []
         
         for key_id, data in self.keys_limits.items():
-            # Daily reset
-            if 'daily_reset_at' in data:
-                try:
-                    if data['daily_reset_at'] and isinstance(data['daily_reset_at'], str):
-                        reset_time = datetime.fromisoformat(data['daily_reset_at'])
-                        if now > reset_time:
-                            data['tokens_used_today'] = 0
-                            data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
-                            changed = True
-                except (ValueError, TypeError):
-                    data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
-                    changed = True
+            changed = False
             
-            # RPM reset
-            if 'rpm_reset_at' in data:
-                try:
-                    if data['rpm_reset_at'] and isinstance(data['rpm_reset_at'], str):
-                        reset_time = datetime.fromisoformat(data['rpm_reset_at'])
-                        if now > reset_time:
-                            data['requests_this_minute'] = 0
-                            data['rpm_reset_at'] = None
-                            changed = True
-                except (ValueError, TypeError):
-                    data['rpm_reset_at'] = None
-                    changed = True
+            for model_data in data.get('models', {}).values():
+                # Окно запросов (RPD) и окно токенов (TPM) сбрасываются независимо
+                for window in ('requests', 'tokens'):
+                    reset_at = model_data.get(f'{window}_reset_at')
+                    if not reset_at:
+                        continue
+                    try:
+                        expired = now > datetime.fromisoformat(reset_at)
+                    except (ValueError, TypeError):
+                        expired = True
+                    if expired:
+                        model_data[f'{window}_used'] = 0
+                        model_data[f'{window}_reset_at'] = None
+                        changed = True
+            
+            if changed:
+                changed_keys.append(key_id)
         
-        if changed:
-            self.save_keys_limits()
+        for key_id in changed_keys:
+            self.save_key_limits(key_id)
+    
+    def reserve_key(self, model=None, tokens=0):
+        """Занять ёмкость ключа под запрос.
+
+        Возвращает (key, 0), если ключ выдан, (None, wait) - если все ключи заняты
+        и ёмкость освободится через wait секунд, (None, None) - если ключей нет.
+        """
+        with self.state_lock:
+            return self._reserve_key(model, tokens)
+    
+    def acquire_key(self, model=None, tokens=0, max_wait=65, should_stop=None):
+        """Блокирующее получение ключа: ждёт ровно до пополнения ёмкости.
+
+        Возвращает None, если ключей нет, ожидание дольше max_wait или пришёл стоп.
+        """
+        deadline = time.monotonic() + max_wait
+        with self.capacity_changed:
+            while True:
+                key, wait = self._reserve_key(model, tokens)
+                if key or wait is None:
+                    return key
+                if should_stop and should_stop():
+                    return None
+                
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return None
+                # Просыпаемся через wait или раньше, если ключи изменились
+                self.capacity_changed.wait(timeout=min(wait, 1.0) if should_stop else wait)
+    
+    def get_capacity_wait(self, models, tokens=0):
+        """Через сколько секунд у какого-нибудь ключа появится ёмкость для одной из моделей.
+
+        None - ждать бесполезно (нет ни одного валидного ключа).
+        """
+        now = time.monotonic()
+        best = None
+        with self.state_lock:
+            for key in self.api_keys:
+                key_id = key[-8:]
+                if self.keys_limits.get(key_id, {}).get('permanently_invalid', False):
+                    continue
+                for model in models:
+                    wait = max(
+                        self.get_cooldown(key_id, model, now),
+                        self.rate_limiter.time_until_available(key_id, model, tokens) if model else 0.0
+                    )
+                    if best is None or wait < best:
+                        best = wait
+        return best
+    
+    def wait_for_capacity(self, models, tokens=0, should_stop=None, on_wait=None):
+        """Спать до ближайшего сброса лимитов вместо отказа no_keys.
+
+        on_wait(seconds_left) вызывается раз в секунду (для обратного отсчёта).
+        Возвращает True - ёмкость появилась, False - стоп или ключей нет.
+        """
+        while True:
+            wait = self.get_capacity_wait(models, tokens)
+            if wait is None:
+                return False
+            if wait <= 0:
+                return True
+            if should_stop and should_stop():
+                return False
+            if on_wait:
+                on_wait(wait)
+            # Просыпаемся раньше, если ключи добавили или сняли с паузы
+            with self.capacity_changed:
+                self.capacity_changed.wait(timeout=min(wait, 1.0))
     
-    def get_next_key(self):
-        """Round-robin выбор следующего валидного ключа"""
+    def notify_capacity_changed(self):
+        """Разбудить потоки, ожидающие свободный ключ"""
+        with self.capacity_changed:
+            self.capacity_changed.notify_all()
+    
+    def _reserve_key(self, model, tokens):
+        """Выбор ключа с ближайшим временем готовности (вызывать под state_lock)"""
         if not self.api_keys:
-            return None
-        
-        # Перечитываем ключи раз в 5 запросов
-        self.request_counter += 1
-        if self.request_counter % 5 == 0:
-            self.reload_api_keys()
-        
-        attempts = 0
-        max_attempts = len(self.api_keys)
+            return None, None
         
-        while attempts < max_attempts:
-            key = self.api_keys[self.current_key_index]
+        now = time.monotonic()
+        while True:
+            key, ready_at = self.selector.peek(model)
+            if key is None:
+                return None, None
+            if ready_at > now:
+                # Никто не готов - точно знаем, сколько ждать
+                return None, ready_at - now
+            
             key_id = key[-8:]
+            wait = self.get_cooldown(key_id, model, now)
+            if wait == 0 and model:
+                # Бюджет модели (token bucket)
+                wait = self.rate_limiter.try_acquire(key_id, model, tokens)
+            if wait > 0:
+                self.selector.schedule(model, key, now + wait)
+                continue
             
-            # Переход к следующему
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            attempts += 1
+            # В конец очереди готовых ключей
+            self.selector.schedule(model, key, now)
+            return key, 0.0
+    
+    def rebuild_selector(self):
+        """Перестроить структуру выбора ключей (после загрузки ключей или состояния)"""
+        with self.state_lock:
+            disabled = [
+                key for key in self.api_keys
+                if self.keys_limits.get(key[-8:], {}).get('permanently_invalid', False)
+            ]
+            self.selector.set_keys(self.api_keys, disabled)
             
-            # Проверка валидности
-            if key_id in self.keys_limits:
-                limits = self.keys_limits[key_id]
-                
-                if limits.get('permanently_invalid', False):
+            # Сохранённые сбросы лимитов разбираем один раз здесь, а не на каждый запрос.
+            # Ключ паркуется только для исчерпанной модели - для остальных он свободен
+            now = datetime.now()
+            for key in self.api_keys:
+                data = self.keys_limits.get(key[-8:])
+                if not data:
                     continue
                 
-                # Проверка RPM
-                if limits.get('requests_this_minute', 0) >= 30:
-                    if limits.get('rpm_reset_at'):
-                        try:
-                            if isinstance(limits['rpm_reset_at'], str):
-                                reset_time = datetime.fromisoformat(limits['rpm_reset_at'])
-                                if datetime.now() < reset_time:
-                                    continue
-                        except:
-                            pass
-                
-                # Проверка TPD
-                if limits.get('tokens_used_today', 0) >= 14400:
-                    continue
+                for model, model_data in data.get('models', {}).items():
+                    reset_at = self.get_model_limit_reset(model_data, now)
+                    if reset_at:
+                        self.park_key(key, model, (reset_at - now).total_seconds())
             
-            return key
-        
-        return None
-        
-    def update_key_limits(self, api_key, headers):
+            self.capacity_changed.notify_all()
+    
+    def update_key_limits(self, api_key, headers, model=None):
         """✅ ИСПРАВЛЕННЫЙ: Обновление лимитов из заголовков API"""
-        key_id = api_key[-8:]
+        with self.state_lock:
+            self._update_key_limits(api_key, headers, model)
         
-        if key_id not in self.keys_limits:
-            self.keys_limits[key_id] = {
-                "total_requests": 0,
-                "total_tokens_in": 0,
-                "total_tokens_out": 0,
-                "prompts_generated": 0,
-                "files_processed": 0,
-                "errors": 0,
-                "requests_this_minute": 0,
-                "tokens_used_today": 0,
-                "rpm_reset_at": None,
-                "daily_reset_at": (datetime.now() + timedelta(days=1)).isoformat(),
-                "invalid_attempts": 0,
-                "permanently_invalid": False
-            }
+        if model:
+            self.rate_limiter.sync_from_headers(api_key[-8:], model, headers)
+    
+    def _update_key_limits(self, api_key, headers, model=None):
+        """Обновление лимитов (вызывать под state_lock)"""
+        key_id = api_key[-8:]
+        data = self.get_key_data(key_id)
         
         # ✅ КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ: Увеличиваем счётчик запросов!
-        self.keys_limits[key_id]['total_requests'] = self.keys_limits[key_id].get('total_requests', 0) + 1
+        data['total_requests'] = data.get('total_requests', 0) + 1
+        increments = {"total_requests": 1}
         
         # Сброс invalid_attempts при успешном запросе
-        self.keys_limits[key_id]['invalid_attempts'] = 0
-        
-        # Обновление из заголовков
-        if 'x-ratelimit-remaining-tokens' in headers:
-            remaining_tokens = int(headers['x-ratelimit-remaining-tokens'])
-            limit_tokens = int(headers.get('x-ratelimit-limit-tokens', 14400))
-            self.keys_limits[key_id]['tokens_used_today'] = limit_tokens - remaining_tokens
+        data['invalid_attempts'] = 0
         
-        if 'x-ratelimit-remaining-requests' in headers:
-            remaining_requests = int(headers['x-ratelimit-remaining-requests'])
-            limit_requests = int(headers.get('x-ratelimit-limit-requests', 30))
-            self.keys_limits[key_id]['requests_this_minute'] = limit_requests - remaining_requests
-        
-        if 'x-ratelimit-reset-requests' in headers:
-            reset_str = headers['x-ratelimit-reset-requests']
-            reset_seconds = self.parse_reset_time(reset_str)
-            self.keys_limits[key_id]['rpm_reset_at'] = (datetime.now() + timedelta(seconds=reset_seconds)).isoformat()
+        if model:
+            # Groq считает лимиты отдельно по каждой модели
+            model_data = self.get_model_data(key_id, model)
+            model_data['total_requests'] = model_data.get('total_requests', 0) + 1
+            increments[model_counter(model, "total_requests")] = 1
+            
+            # Заголовки: *-requests - суточное окно (RPD), *-tokens - минутное (TPM)
+            now = datetime.now()
+            for window in ('requests', 'tokens'):
+                remaining = headers.get(f'x-ratelimit-remaining-{window}')
+                limit = headers.get(f'x-ratelimit-limit-{window}')
+                if remaining is not None and limit is not None:
+                    try:
+                        model_data[f'{window}_limit'] = int(limit)
+                        model_data[f'{window}_used'] = max(0, int(limit) - int(remaining))
+                    except ValueError:
+                        pass
+                
+                reset = headers.get(f'x-ratelimit-reset-{window}')
+                if reset is not None:
+                    reset_seconds = self.parse_reset_time(reset)
+                    model_data[f'{window}_reset_at'] = (now + timedelta(seconds=reset_seconds)).isoformat()
+                    
+                    # Окно исчерпано - ключ не выдаётся для этой модели до сброса
+                    if remaining == '0':
+                        self.park_key(api_key, model, reset_seconds)
         
-        self.save_keys_limits()
+        self.save_key_limits(key_id, increments)
 
     def parse_reset_time(self, reset_str):
-        """Парсинг времени сброса из строки типа '1m30s'"""
-        total_seconds = 0
-        
-        hours = re.search(r'(\d+)h', reset_str)
-        minutes = re.search(r'(\d+)m', reset_str)
-        seconds = re.search(r'([\d.]+)s', reset_str)
-        
-        if hours:
-            total_seconds += int(hours.group(1)) * 3600
-        if minutes:
-            total_seconds += int(minutes.group(1)) * 60
-        if seconds:
-            total_seconds += float(seconds.group(1))
-        
-        return int(total_seconds)
+        """Парсинг времени сброса из строки типа '1m30s' / '7.66s' / '120ms'"""
+        seconds = parse_duration(reset_str)
+        return seconds if seconds is not None else 0
+    
+    def park_key(self, api_key, model=None, seconds=DEFAULT_COOLDOWN):
+        """Отправить ключ отдыхать на seconds секунд (только для этой модели).
+
+        Остальные ключи продолжают работать, ожидающие потоки будят по истечении паузы.
+        """
+        key_id = api_key[-8:]
+        with self.state_lock:
+            deadline = time.monotonic() + seconds
+            # Паузу только продлеваем, не укорачиваем
+            if deadline > self.cooldowns.get((key_id, model), 0):
+                self.cooldowns[(key_id, model)] = deadline
+                if model is None:
+                    self.selector.schedule_all_models(api_key, deadline)
+                else:
+                    self.selector.schedule(model, api_key, deadline)
+            self.capacity_changed.notify_all()
+    
+    def get_cooldown(self, key_id, model=None, now=None):
+        """Сколько секунд ещё отдыхает ключ (0 - свободен). Вызывать под state_lock"""
+        now = now if now is not None else time.monotonic()
+        wait = 0.0
+        for pair in ((key_id, model), (key_id, None)):
+            deadline = self.cooldowns.get(pair)
+            if deadline is None:
+                continue
+            if deadline <= now:
+                del self.cooldowns[pair]
+            else:
+                wait = max(wait, deadline - now)
+        return wait
     
     def mark_key_invalid(self, api_key):
         """Отметка ключа как невалидного"""
+        with self.state_lock:
+            self._mark_key_invalid(api_key)
+            self.capacity_changed.notify_all()
+    
+    def _mark_key_invalid(self, api_key):
+        """Отметка ключа как невалидного (вызывать под state_lock)"""
         key_id = api_key[-8:]
-        
-        if key_id not in self.keys_limits:
-            self.keys_limits[key_id] = {
-                "total_requests": 0,
-                "total_tokens_in": 0,
-                "total_tokens_out": 0,
-                "prompts_generated": 0,
-                "files_processed": 0,
-                "errors": 0,
-                "invalid_attempts": 1,
-                "permanently_invalid": False
-            }
-        else:
-            self.keys_limits[key_id]['invalid_attempts'] = self.keys_limits[key_id].get('invalid_attempts', 0) + 1
+        data = self.get_key_data(key_id)
+        data['invalid_attempts'] = data.get('invalid_attempts', 0) + 1
         
         # После 3 попыток - permanent invalid
         if self.keys_limits[key_id]['invalid_attempts'] >= 3:
             self.keys_limits[key_id]['permanently_invalid'] = True
+            self.selector.disable(api_key)
         
-        self.save_keys_limits()
+        self.save_key_limits(key_id)
+    
+    @staticmethod
+    def new_key_data():
+        """Запись статистики нового ключа"""
+        return {
+            "total_requests": 0,
+            "total_tokens_in": 0,
+            "total_tokens_out": 0,
+            "prompts_generated": 0,
+            "files_processed": 0,
+            "errors": 0,
+            "invalid_attempts": 0,
+            "permanently_invalid": False,
+            "models": {}
+        }
+    
+    @staticmethod
+    def new_model_data():
+        """Статистика ключа по одной модели"""
+        return {
+            "total_requests": 0,
+            "total_tokens_in": 0,
+            "total_tokens_out": 0,
+            "requests_used": 0,
+            "requests_limit": None,
+            "requests_reset_at": None,
+            "tokens_used": 0,
+            "tokens_limit": None,
+            "tokens_reset_at": None
+        }
+    
+    def get_key_data(self, key_id):
+        """Статистика ключа (создаётся при первом обращении). Вызывать под state_lock"""
+        if key_id not in self.keys_limits:
+            self.keys_limits[key_id] = self.new_key_data()
+        return self.keys_limits[key_id]
+    
+    def get_model_data(self, key_id, model):
+        """Статистика ключа по модели (создаётся при первом обращении). Вызывать под state_lock"""
+        models = self.get_key_data(key_id).setdefault('models', {})
+        if model not in models:
+            models[model] = self.new_model_data()
+        return models[model]
+    
+    @staticmethod
+    def get_model_limit_reset(model_data, now=None):
+        """Время сброса, если ключ исчерпал лимит модели; None - лимит не исчерпан"""
+        now = now or datetime.now()
+        reset_at = None
+        for window in ('requests', 'tokens'):
+            limit = model_data.get(f'{window}_limit')
+            if not limit or model_data.get(f'{window}_used', 0) < limit:
+                continue
+            try:
+                window_reset = datetime.fromisoformat(model_data.get(f'{window}_reset_at') or '')
+            except ValueError:
+                continue
+            if window_reset > now and (reset_at is None or window_reset > reset_at):
+                reset_at = window_reset
+        return reset_at
+    
+    def get_key_status(self, key_id, model=None, now=None):
+        """Состояние ключа для модели: ("invalid" | "limit" | "active", время сброса)"""
+        data = self.keys_limits.get(key_id)
+        if data is None:
+            return "active", None
+        if data.get('permanently_invalid', False):
+            return "invalid", None
+        if model:
+            reset_at = self.get_model_limit_reset(data.get('models', {}).get(model, {}), now)
+            if reset_at:
+                return "limit", reset_at
+        return "active", None
     
-    def get_stats(self):
-        """Получить статистику по всем ключам"""
+    def get_healthy_keys(self, model=None):
+        """Ключи, которые сейчас можно использовать (не невалидные и не на лимите модели)"""
+        now = datetime.now()
+        with self.state_lock:
+            return [
+                key for key in self.api_keys
+                if self.get_key_status(key[-8:], model, now)[0] == "active"
+            ]
+    
+    def get_stats(self, model=None):
+        """Получить статистику по всем ключам (лимиты - для модели model)"""
+        self.sync_from_store()
+        
         active = 0
         on_limit = 0
         inactive = 0
         nearest_reset = None
+        now = datetime.now()
         
-        for key in self.api_keys:
-            key_id = key[-8:]
-            
-            if key_id in self.keys_limits:
-                data = self.keys_limits[key_id]
+        with self.state_lock:
+            for key in self.api_keys:
+                status, reset_at = self.get_key_status(key[-8:], model, now)
                 
-                if data.get('permanently_invalid', False):
+                if status == "invalid":
                     inactive += 1
-                elif data.get('tokens_used_today', 0) >= 14400:
-                    on_limit += 1
-                    if data.get('daily_reset_at'):
-                        try:
-                            reset_time = datetime.fromisoformat(data['daily_reset_at'])
-                            if nearest_reset is None or reset_time < nearest_reset:
-                                nearest_reset = reset_time
-                        except:
-                            pass
-                elif data.get('requests_this_minute', 0) >= 30:
+                elif status == "limit":
                     on_limit += 1
-                    if data.get('rpm_reset_at'):
-                        try:
-                            reset_time = datetime.fromisoformat(data['rpm_reset_at'])
-                            if nearest_reset is None or reset_time < nearest_reset:
-                                nearest_reset = reset_time
-                        except:
-                            pass
+                    if nearest_reset is None or reset_at < nearest_reset:
+                        nearest_reset = reset_at
                 else:
                     active += 1
-            else:
-                active += 1
         
         return active, on_limit, inactive, nearest_reset
     
@@ -277,24 +546,106 @@ class KeyManager:
     def add_prompts_generated(self, api_key, count):
         """Добавить количество сгенерированных промптов"""
         key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['prompts_generated'] = \
-                self.keys_limits[key_id].get('prompts_generated', 0) + count
-            self.save_keys_limits()
+        with self.state_lock:
+            data = self.get_key_data(key_id)
+            data['prompts_generated'] = data.get('prompts_generated', 0) + count
+            self.save_key_limits(key_id, {"prompts_generated": count})
 
     def add_file_processed(self, api_key):
         """Зафиксировать обработку одного файла"""
         key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['files_processed'] = \
-                self.keys_limits[key_id].get('files_processed', 0) + 1
-            self.save_keys_limits()
+        with self.state_lock:
+            data = self.get_key_data(key_id)
+            data['files_processed'] = data.get('files_processed', 0) + 1
+            self.save_key_limits(key_id, {"files_processed": 1})
 
     def add_error(self, api_key):
         """Зафиксировать ошибку при обработке"""
         key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['errors'] = \
-                self.keys_limits[key_id].get('errors', 0) + 1
-            self.save_keys_limits()
-
+        with self.state_lock:
+            data = self.get_key_data(key_id)
+            data['errors'] = data.get('errors', 0) + 1
+            self.save_key_limits(key_id, {"errors": 1})
+    
+    # АРЕНДА КЛЮЧЕЙ: счётчики пишутся в ключ, который реально обслужил запрос
+    
+    def open_lease(self, api_key, model=None, tokens=0):
+        """Оформить аренду уже выданного ключа"""
+        return KeyLease(self, api_key, model, tokens)
+    
+    def acquire_lease(self, model=None, tokens=0, max_wait=65, should_stop=None):
+        """Получить ключ (с ожиданием ёмкости) сразу в виде аренды"""
+        api_key = self.acquire_key(model, tokens, max_wait=max_wait, should_stop=should_stop)
+        if not api_key:
+            return None
+        return self.open_lease(api_key, model, tokens)
+    
+    def release_lease(self, lease, outcome, latency=None, usage=None):
+        """Вернуть ключ: исход, задержка и расход токенов записываются в этот ключ"""
+        key_id = lease.key_id
+        with self.state_lock:
+            data = self.get_key_data(key_id)
+            data['last_outcome'] = outcome
+            if latency is not None:
+                # Скользящее среднее времени ответа
+                data['avg_latency'] = self.moving_average(data.get('avg_latency'), latency)
+            
+            increments = {}
+            if usage:
+                records = [data]
+                if lease.model:
+                    records.append(self.get_model_data(key_id, lease.model))
+                    self.add_session_usage(lease.model, usage)
+                self.add_session_usage(None, usage)
+                
+                tokens_in = int(usage.get('prompt_tokens', 0) or 0)
+                tokens_out = int(usage.get('completion_tokens', 0) or 0)
+                for record in records:
+                    record['total_tokens_in'] = record.get('total_tokens_in', 0) + tokens_in
+                    record['total_tokens_out'] = record.get('total_tokens_out', 0) + tokens_out
+                    # Время на стороне сервера: ожидание в очереди и полная обработка
+                    for name in ('queue_time', 'total_time'):
+                        if usage.get(name) is not None:
+                            record[f'avg_{name}'] = self.moving_average(record.get(f'avg_{name}'), usage[name])
+                
+                increments = {"total_tokens_in": tokens_in, "total_tokens_out": tokens_out}
+                if lease.model:
+                    increments[model_counter(lease.model, "total_tokens_in")] = tokens_in
+                    increments[model_counter(lease.model, "total_tokens_out")] = tokens_out
+            
+            self.save_key_limits(key_id, increments)
+        
+        # Бюджет модели: фактический расход вместо оценки
+        if usage and lease.model:
+            self.rate_limiter.settle(key_id, lease.model, lease.tokens, usage)
+            self.notify_capacity_changed()
+    
+    @staticmethod
+    def moving_average(previous, value):
+        """Скользящее среднее (новое значение с весом 0.2)"""
+        value = float(value)
+        return round(value if previous is None else previous * 0.8 + value * 0.2, 3)
+    
+    @staticmethod
+    def new_usage_totals():
+        """Пустые суммы расхода"""
+        return {"requests": 0, "tokens_in": 0, "tokens_out": 0, "queue_time": 0.0, "total_time": 0.0}
+    
+    def add_session_usage(self, model, usage):
+        """Расход за текущий запуск программы (model=None - по всем моделям). Под state_lock"""
+        totals = self.session_usage.setdefault(model or "", self.new_usage_totals())
+        totals["requests"] += 1
+        totals["tokens_in"] += int(usage.get('prompt_tokens', 0) or 0)
+        totals["tokens_out"] += int(usage.get('completion_tokens', 0) or 0)
+        totals["queue_time"] += float(usage.get('queue_time', 0) or 0)
+        totals["total_time"] += float(usage.get('total_time', 0) or 0)
+    
+    def get_session_usage(self, model=None):
+        """Расход токенов за запуск: по модели или по всем (model=None)"""
+        with self.state_lock:
+            return dict(self.session_usage.get(model or "") or self.new_usage_totals())
+    
+    def reset_session_usage(self):
+        """Сброс расхода за запуск"""
+        with self.state_lock:
+            self.session_usage.clear()
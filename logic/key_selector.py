@@ -0,0 +1,97 @@
+import heapq
+import itertools
+
+
+class KeySelector:
+    """Выбор ключа за O(log n): для каждой модели куча (время готовности, очередь, ключ).
+
+    Время - time.monotonic(). Перепланирование ключа кладёт в кучу новую запись,
+    а старая становится устаревшей (проверяется по версии) и выбрасывается при извлечении.
+    Ключи с одинаковым временем выдаются по очереди (round-robin).
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.active = set()
+        self.heaps = {}
+        self.versions = {}
+        self.sequence = itertools.count()
+
+    def set_keys(self, keys, disabled=()):
+        """Новый набор ключей (кучи перестраиваются лениво)"""
+        self.keys = list(keys)
+        self.active = set(self.keys) - set(disabled)
+        self.heaps.clear()
+        self.versions.clear()
+
+    def get_heap(self, model):
+        """Куча модели (создаётся при первом обращении: все активные ключи готовы сразу)"""
+        heap = self.heaps.get(model)
+        if heap is None:
+            heap = []
+            for key in self.keys:
+                if key in self.active:
+                    version = self.versions.get((model, key), 0)
+                    heap.append((0.0, next(self.sequence), key, version))
+            heapq.heapify(heap)
+            self.heaps[model] = heap
+        return heap
+
+    def schedule(self, model, key, ready_at):
+        """Ключ будет готов для модели в момент ready_at"""
+        if key not in self.active:
+            return
+        heap = self.get_heap(model)
+        version = self.versions.get((model, key), 0) + 1
+        self.versions[(model, key)] = version
+        heapq.heappush(heap, (ready_at, next(self.sequence), key, version))
+
+        # Слишком много устаревших записей - пересобираем
+        if len(heap) > 2 * len(self.active) + 16:
+            self.compact(model)
+
+    def schedule_all_models(self, key, ready_at):
+        """Ключ недоступен до ready_at для всех моделей"""
+        for model in list(self.heaps):
+            self.schedule(model, key, ready_at)
+
+    def compact(self, model):
+        """Оставить в куче только актуальные записи"""
+        heap = [entry for entry in self.heaps[model] if self.is_current(model, entry)]
+        heapq.heapify(heap)
+        self.heaps[model] = heap
+
+    def is_current(self, model, entry):
+        """Запись актуальна: ключ активен и версия последняя"""
+        _, _, key, version = entry
+        return key in self.active and self.versions.get((model, key), 0) == version
+
+    def peek(self, model):
+        """Ключ с ближайшим временем готовности: (key, ready_at) или (None, None)"""
+        heap = self.get_heap(model)
+        while heap:
+            entry = heap[0]
+            if self.is_current(model, entry):
+                return entry[2], entry[0]
+            heapq.heappop(heap)
+        return None, None
+
+    def disable(self, key):
+        """Исключить ключ из выдачи (невалидный / удалён)"""
+        self.active.discard(key)
+
+    def remove(self, key):
+        """Убрать ключ из набора (удалён из файла ключей)"""
+        self.disable(key)
+        if key in self.keys:
+            self.keys.remove(key)
+
+    def enable(self, key):
+        """Вернуть ключ в выдачу (готов сразу)"""
+        if key in self.active:
+            return
+        if key not in self.keys:
+            self.keys.append(key)
+        self.active.add(key)
+        for model in list(self.heaps):
+            self.schedule(model, key, 0.0)
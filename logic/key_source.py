@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+def read_keys_file(path):
+    """Ключи из файла (один на строку, # - комментарий); None, если файла нет"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [
+                line.strip() for line in f
+                if line.strip() and not line.strip().startswith('#')
+            ]
+    except OSError:
+        return None
+
+
+class KeySourceWatcher:
+    """Следит за файлом ключей и вызывает on_change(keys) только когда он изменился.
+
+    Изменение определяется по mtime + размеру файла (дешёвый os.stat раз в interval
+    секунд) или по событию inotify на Linux, если установлен inotify_simple.
+    Проверка идёт в фоновом потоке - на пути запроса нет файлового ввода-вывода.
+    """
+
+    def __init__(self, path, on_change, interval=2.0, logger=None):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.interval = interval
+        self.logger = logger
+        self.signature = self.get_signature()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def get_signature(self):
+        """(mtime, размер) файла или None, если его нет"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Проверить файл; при изменении перечитать и передать ключи в on_change"""
+        signature = self.get_signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+
+        keys = read_keys_file(self.path)
+        if not keys:
+            # Файл удалён или пуст (например, редактор сохраняет его в несколько шагов) -
+            # оставляем текущий набор ключей
+            self.log(f"⚠️ Файл ключей {os.path.basename(self.path)} пуст или не найден, ключи не изменены", "warning")
+            return False
+
+        try:
+            self.on_change(keys)
+        except Exception as e:
+            self.log(f"❌ Ошибка применения ключей: {str(e)}", "error")
+            return False
+        return True
+
+    def start(self):
+        """Запустить фоновое наблюдение"""
+        if self.thread:
+            return
+        target = self.watch_inotify if self.can_use_inotify() else self.watch_polling
+        self.thread = threading.Thread(target=target, name="keys-file-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Остановить наблюдение"""
+        self.stopped.set()
+
+    def can_use_inotify(self):
+        """inotify доступен (Linux + пакет inotify_simple)"""
+        return inotify_simple is not None and sys.platform.startswith("linux")
+
+    def watch_polling(self):
+        """Опрос mtime/размера раз в interval секунд"""
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def watch_inotify(self):
+        """События inotify по папке файла (ловит и атомарную замену через rename)"""
+        flags = inotify_simple.flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE
+        name = os.path.basename(self.path)
+
+        with inotify_simple.INotify() as inotify:
+            inotify.add_watch(os.path.dirname(self.path), mask)
+            while not self.stopped.is_set():
+                # Таймаут - чтобы заметить stop() и подстраховаться опросом
+                events = inotify.read(timeout=int(self.interval * 1000))
+                if not events or any(event.name == name for event in events):
+                    self.check()
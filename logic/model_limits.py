@@ -38,6 +38,14 @@ MODEL_LIMITS = {
     }
 }
 
+# Цепочки резервных моделей: когда у всех ключей кончилась квота модели,
+# чанк уходит на следующую модель цепочки, у которой ещё есть ёмкость
+MODEL_FALLBACKS = {
+    "llama-3.3-70b-versatile": ["openai/gpt-oss-20b", "llama-3.1-8b-instant"],
+    "openai/gpt-oss-120b": ["openai/gpt-oss-20b", "llama-3.1-8b-instant"],
+    "openai/gpt-oss-20b": ["llama-3.1-8b-instant"]
+}
+
 def get_model_rpd(model_name):
     """Получить RPD лимит для модели"""
     return MODEL_LIMITS.get(model_name, {}).get('rpd', 1000)
@@ -45,3 +53,12 @@ def get_model_rpd(model_name):
 def get_model_info(model_name):
     """Получить всю информацию о модели"""
     return MODEL_LIMITS.get(model_name, {})
+
+def get_fallback_chain(model_name, fallbacks=None):
+    """Модель и её резервные модели по порядку (без повторов, только известные)"""
+    fallbacks = MODEL_FALLBACKS if fallbacks is None else fallbacks
+    chain = [model_name]
+    for fallback in fallbacks.get(model_name, []):
+        if fallback in MODEL_LIMITS and fallback not in chain:
+            chain.append(fallback)
+    return chain
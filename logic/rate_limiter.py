@@ -0,0 +1,190 @@
+import threading
+import time
+
+from logic.model_limits import MODEL_LIMITS
+
+# Лимиты по умолчанию для моделей, которых нет в MODEL_LIMITS
+DEFAULT_LIMITS = {
+    "rpm": 30,
+    "tpm": 6000,
+    "rpd": 1000,
+    "tpd": 100000
+}
+
+# Окна лимитов в секундах
+WINDOWS = {
+    "rpm": 60,
+    "tpm": 60,
+    "rpd": 86400,
+    "tpd": 86400
+}
+
+# Сколько токенов резервировать под ответ модели
+DEFAULT_OUTPUT_TOKENS = 1000
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов (≈3 символа на токен, кириллица дороже латиницы)"""
+    if not text:
+        return 0
+    return len(text) // 3 + 1
+
+
+def estimate_request_tokens(system_prompt, user_message, output_tokens=DEFAULT_OUTPUT_TOKENS):
+    """Оценка токенов запроса: вход + резерв на ответ"""
+    return estimate_tokens(system_prompt) + estimate_tokens(user_message) + output_tokens
+
+
+class TokenBucket:
+    """Token bucket: capacity единиц, равномерно пополняется за period секунд"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        """Пополнить корзину на момент now"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def time_until(self, amount, now):
+        """Через сколько секунд в корзине будет amount единиц (0 - уже есть)"""
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now):
+        """Списать amount единиц"""
+        self.refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount, now):
+        """Вернуть неизрасходованное (например, если ответ оказался короче резерва)"""
+        self.refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def set_remaining(self, remaining, now):
+        """Синхронизация с сервером: в корзине не больше, чем осталось по заголовкам"""
+        self.refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class RateScheduler:
+    """Планировщик запросов по лимитам модели (RPM/TPM/RPD/TPD) для каждой пары ключ+модель"""
+
+    def __init__(self, limits=None):
+        self.limits = limits if limits is not None else MODEL_LIMITS
+        self.buckets = {}
+        # Средняя длина ответа по модели (из usage) - сколько резервировать под вывод
+        self.output_estimates = {}
+        self.lock = threading.Lock()
+
+    def get_limits(self, model):
+        """Лимиты модели (с подстановкой значений по умолчанию)"""
+        limits = dict(DEFAULT_LIMITS)
+        limits.update({k: v for k, v in self.limits.get(model, {}).items() if k in WINDOWS})
+        return limits
+
+    def get_buckets(self, key_id, model):
+        """Корзины для пары ключ+модель (под lock)"""
+        pair = (key_id, model)
+        if pair not in self.buckets:
+            limits = self.get_limits(model)
+            self.buckets[pair] = {
+                name: TokenBucket(limits[name], period)
+                for name, period in WINDOWS.items()
+            }
+        return self.buckets[pair]
+
+    @staticmethod
+    def get_amounts(tokens):
+        """Сколько списывать из каждой корзины за один запрос"""
+        return {"rpm": 1, "rpd": 1, "tpm": tokens, "tpd": tokens}
+
+    def time_until_available(self, key_id, model, tokens):
+        """Через сколько секунд ключ сможет принять запрос на tokens токенов"""
+        now = time.monotonic()
+        amounts = self.get_amounts(tokens)
+        with self.lock:
+            buckets = self.get_buckets(key_id, model)
+            return max(bucket.time_until(amounts[name], now) for name, bucket in buckets.items())
+
+    def try_acquire(self, key_id, model, tokens):
+        """Занять ёмкость под запрос. Возвращает 0 при успехе, иначе сколько ждать"""
+        now = time.monotonic()
+        amounts = self.get_amounts(tokens)
+        with self.lock:
+            buckets = self.get_buckets(key_id, model)
+            wait = max(bucket.time_until(amounts[name], now) for name, bucket in buckets.items())
+            if wait > 0:
+                return wait
+            for name, bucket in buckets.items():
+                bucket.consume(amounts[name], now)
+            return 0.0
+
+    def get_output_estimate(self, model):
+        """Сколько токенов резервировать под ответ модели"""
+        with self.lock:
+            estimate = self.output_estimates.get(model)
+        if estimate is None:
+            return DEFAULT_OUTPUT_TOKENS
+        # Запас сверху: ответ длиннее среднего не должен упираться в TPM
+        return int(estimate * 1.2) + 1
+
+    def settle(self, key_id, model, reserved, usage):
+        """Фактический расход запроса (usage из ответа) вместо оценки.
+
+        Недорасход возвращается в корзины TPM/TPD, перерасход списывается дополнительно,
+        средняя длина ответа модели обновляется для следующих резервов.
+        """
+        used = int(usage.get('total_tokens', 0) or 0)
+        completion = usage.get('completion_tokens')
+        if completion is not None:
+            with self.lock:
+                previous = self.output_estimates.get(model)
+                completion = int(completion)
+                self.output_estimates[model] = completion if previous is None else previous * 0.8 + completion * 0.2
+
+        if not used:
+            return
+        if used < reserved:
+            self.release_unused(key_id, model, reserved - used)
+        elif used > reserved:
+            now = time.monotonic()
+            with self.lock:
+                buckets = self.get_buckets(key_id, model)
+                buckets["tpm"].consume(used - reserved, now)
+                buckets["tpd"].consume(used - reserved, now)
+
+    def release_unused(self, key_id, model, tokens):
+        """Вернуть в корзины токены, зарезервированные, но не потраченные"""
+        if tokens <= 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            buckets = self.get_buckets(key_id, model)
+            buckets["tpm"].refund(tokens, now)
+            buckets["tpd"].refund(tokens, now)
+
+    def sync_from_headers(self, key_id, model, headers):
+        """Подстроить корзины под x-ratelimit-remaining-* из ответа.
+
+        У Groq x-ratelimit-*-requests относится к суточному окну (RPD),
+        а x-ratelimit-*-tokens - к минутному (TPM).
+        """
+        now = time.monotonic()
+        with self.lock:
+            buckets = self.get_buckets(key_id, model)
+            try:
+                if 'x-ratelimit-remaining-requests' in headers:
+                    buckets["rpd"].set_remaining(int(headers['x-ratelimit-remaining-requests']), now)
+                if 'x-ratelimit-remaining-tokens' in headers:
+                    buckets["tpm"].set_remaining(int(headers['x-ratelimit-remaining-tokens']), now)
+            except (ValueError, TypeError):
+                pass
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class ResponseCache:
+    """Кэш ответов API на диске (ключ - хэш модели, промпта, текста чанка и параметров)"""
+
+    def __init__(self, cache_dir="logs/response_cache", max_size_mb=200, max_age_days=30, logger=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.puts_since_evict = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def make_key(model, system_prompt, chunk_text, temperature, prompts_count):
+        """Хэш всего, что влияет на ответ модели"""
+        payload = json.dumps(
+            [model, system_prompt, chunk_text, float(temperature), int(prompts_count)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_path(self, key):
+        """Файл записи (разбит по подпапкам, чтобы не держать тысячи файлов в одной)"""
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Ответ из кэша или None"""
+        path = self.get_path(key)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        if self.max_age and time.time() - stat.st_mtime > self.max_age:
+            self.remove(path)
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.remove(path)
+            return None
+
+        # Обновляем время доступа для вытеснения по давности использования
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return entry.get('response')
+
+    def put(self, key, response, model=None):
+        """Сохранить ответ (атомарно: временный файл + rename)"""
+        path = self.get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "model": model,
+                    "created": time.time(),
+                    "response": response
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.log(f"⚠️ Не удалось записать кэш ответа: {str(e)}", "warning")
+            self.remove(tmp_path)
+            return False
+
+        with self.lock:
+            self.puts_since_evict += 1
+            need_evict = self.puts_since_evict >= 100
+            if need_evict:
+                self.puts_since_evict = 0
+        if need_evict:
+            self.evict()
+        return True
+
+    @staticmethod
+    def remove(path):
+        """Удалить файл, не обращая внимания на ошибки"""
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def evict(self):
+        """Удаление устаревших записей и самых давно использованных сверх лимита размера"""
+        with self.lock:
+            now = time.time()
+            entries = []
+            total_size = 0
+
+            for path in self.cache_dir.glob("*/*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+
+                if self.max_age and now - stat.st_mtime > self.max_age:
+                    self.remove(path)
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+            removed = 0
+            if self.max_size and total_size > self.max_size:
+                entries.sort()
+                for _, size, path in entries:
+                    if total_size <= self.max_size:
+                        break
+                    self.remove(path)
+                    total_size -= size
+                    removed += 1
+
+            return removed
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self.lock:
+            count = 0
+            for path in self.cache_dir.glob("*/*.json"):
+                self.remove(path)
+                count += 1
+            return count
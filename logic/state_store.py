@@ -0,0 +1,338 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+
+
+class JsonStateStore:
+    """Хранилище состояния ключей в JSON с отложенной записью (write-behind).
+
+    Изменения копятся в памяти и сбрасываются на диск раз в flush_interval секунд,
+    после flush_every изменений или при закрытии. Запись атомарная
+    (временный файл + rename), так что падение не оставит битый JSON.
+    """
+
+    def __init__(self, path, get_data, lock, flush_interval=2.0, flush_every=50):
+        self.path = path
+        # get_data() возвращает актуальный словарь состояния (он может быть заменён целиком)
+        self.get_data = get_data
+        # Блокировка, под которой меняется состояние (для консистентного снимка)
+        self.lock = lock
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+
+        # write_lock - только для файла; pending_lock - только для счётчика
+        # (никогда не держится при захвате других блокировок)
+        self.write_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = 0
+        self.closed = False
+        self.wakeup = threading.Event()
+
+        self.thread = threading.Thread(target=self.flush_loop, name="keys-state-flush", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def load_all(self):
+        """Чтение состояния с диска"""
+        if not os.path.exists(self.path):
+            return {}
+
+        with self.write_lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except ValueError:
+                # Файл повреждён (например, запись старой версией оборвалась)
+                os.replace(self.path, self.path + ".corrupt")
+                return {}
+
+    def save_key(self, key_id, data=None, increments=None):
+        """Отметить изменение одного ключа"""
+        self.mark_dirty()
+
+    def save_all(self, data=None):
+        """Отметить изменение всего состояния"""
+        self.mark_dirty()
+
+    def changed_externally(self):
+        """JSON-файл принадлежит одному процессу"""
+        return False
+
+    def mark_dirty(self):
+        """Есть несохранённые изменения"""
+        with self.pending_lock:
+            self.pending += 1
+            if self.pending >= self.flush_every:
+                self.wakeup.set()
+
+    def flush_loop(self):
+        """Фоновый сброс изменений на диск"""
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Записать состояние на диск, если есть изменения"""
+        with self.write_lock:
+            with self.pending_lock:
+                if not self.pending:
+                    return False
+
+            with self.lock:
+                text = json.dumps(self.get_data(), indent=2)
+                with self.pending_lock:
+                    self.pending = 0
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+
+    def close(self):
+        """Остановить фоновую запись и сохранить остаток"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+
+
+# Разделитель пути к вложенному счётчику: "models|<модель>|total_requests"
+PATH_SEPARATOR = "|"
+
+# Счётчики, которые при импорте из JSON переносятся в таблицу key_counters
+COUNTER_FIELDS = (
+    "total_requests",
+    "total_tokens_in",
+    "total_tokens_out",
+    "prompts_generated",
+    "files_processed",
+    "errors"
+)
+
+
+def get_path_value(data, name):
+    """Значение по пути 'a|b|c' во вложенном словаре (0, если нет)"""
+    value = data
+    for part in name.split(PATH_SEPARATOR):
+        if not isinstance(value, dict) or part not in value:
+            return 0
+        value = value[part]
+    return value if isinstance(value, (int, float)) else 0
+
+
+def set_path_value(data, name, value):
+    """Записать значение по пути 'a|b|c', создавая промежуточные словари"""
+    parts = name.split(PATH_SEPARATOR)
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+class SqliteStateStore:
+    """Хранилище состояния ключей в SQLite (WAL).
+
+    Строка ключа обновляется одним UPSERT, счётчики - атомарным value = value + ?,
+    поэтому несколько процессов могут работать с одним пулом ключей.
+    Читатели (вкладка статистики) не блокируют писателей благодаря WAL.
+    """
+
+    def __init__(self, path, import_json=None):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        # Номер последней известной записи (строка commits в store_meta) - см. changed_externally
+        self.seen_version = None
+        self.version_lock = threading.Lock()
+
+        conn = self.connect()
+        with self.transaction():
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS key_state ("
+                "key_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS key_counters ("
+                "key_id TEXT NOT NULL, name TEXT NOT NULL, value INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (key_id, name))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_meta ("
+                "name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("INSERT OR IGNORE INTO store_meta (name, value) VALUES ('commits', 0)")
+
+        # Первый запуск: переносим состояние из старого JSON
+        if import_json and os.path.exists(import_json):
+            empty = conn.execute("SELECT COUNT(*) FROM key_state").fetchone()[0] == 0
+            if empty:
+                self.import_json(import_json)
+
+    def connect(self):
+        """Отдельное соединение на каждый поток"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
+
+    def transaction(self):
+        """Транзакция записи (BEGIN IMMEDIATE - без взаимоблокировок при апгрейде читателя)"""
+        return SqliteTransaction(self.connect(), self)
+
+    def record_commit(self, conn):
+        """Увеличить счётчик записей (внутри транзакции записи).
+
+        Если до нашей записи счётчик был равен известному нам номеру - запись своя,
+        номер сдвигается; иначе между ними писал другой процесс, и номер остаётся
+        старым, чтобы changed_externally это заметил.
+        """
+        row = conn.execute("SELECT value FROM store_meta WHERE name = 'commits'").fetchone()
+        if row is None:
+            # Таблица создаётся в __init__, до неё счётчика ещё нет
+            return
+        conn.execute("UPDATE store_meta SET value = ? WHERE name = 'commits'", (row[0] + 1,))
+        with self.version_lock:
+            if self.seen_version == row[0]:
+                self.seen_version = row[0] + 1
+
+    def import_json(self, json_path):
+        """Импорт keys_limits.json"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        with self.transaction() as conn:
+            for key_id, key_data in data.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO key_state (key_id, data) VALUES (?, ?)",
+                    (key_id, json.dumps(key_data))
+                )
+                for name in COUNTER_FIELDS:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO key_counters (key_id, name, value) VALUES (?, ?, ?)",
+                        (key_id, name, int(key_data.get(name, 0) or 0))
+                    )
+        return len(data)
+
+    def load_all(self):
+        """Состояние всех ключей: строки key_state + актуальные счётчики"""
+        conn = self.connect()
+        data = {}
+        # Один снимок БД на строки, счётчики и номер записи
+        conn.execute("BEGIN")
+        try:
+            for key_id, raw in conn.execute("SELECT key_id, data FROM key_state"):
+                try:
+                    data[key_id] = json.loads(raw)
+                except ValueError:
+                    data[key_id] = {}
+
+            for key_id, name, value in conn.execute("SELECT key_id, name, value FROM key_counters"):
+                if key_id in data:
+                    set_path_value(data[key_id], name, value)
+
+            version = self.get_version(conn)
+        finally:
+            conn.execute("COMMIT")
+
+        with self.version_lock:
+            self.seen_version = version
+        return data
+
+    def get_version(self, conn=None):
+        """Номер последней записи в БД (любым процессом)"""
+        conn = conn or self.connect()
+        row = conn.execute("SELECT value FROM store_meta WHERE name = 'commits'").fetchone()
+        return row[0] if row else 0
+
+    def changed_externally(self):
+        """Была ли запись из другого процесса с момента последнего чтения.
+
+        Свои записи (из любого потока этого процесса) сдвигают seen_version
+        в record_commit, поэтому сюда не попадают.
+        """
+        version = self.get_version()
+        with self.version_lock:
+            return version != self.seen_version
+
+    def save_key(self, key_id, data=None, increments=None):
+        """Одна строка ключа + атомарное увеличение счётчиков"""
+        if data is None:
+            return
+
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO key_state (key_id, data) VALUES (?, ?) "
+                "ON CONFLICT(key_id) DO UPDATE SET data = excluded.data",
+                (key_id, json.dumps(data))
+            )
+            for name, amount in (increments or {}).items():
+                # Новая строка получает текущее значение из памяти, существующая - прибавку
+                conn.execute(
+                    "INSERT INTO key_counters (key_id, name, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key_id, name) DO UPDATE SET value = value + ?",
+                    (key_id, name, get_path_value(data, name), amount)
+                )
+
+    def save_all(self, data):
+        """Полная замена состояния (сброс статистики)"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM key_state")
+            conn.execute("DELETE FROM key_counters")
+            for key_id, key_data in data.items():
+                conn.execute(
+                    "INSERT INTO key_state (key_id, data) VALUES (?, ?)",
+                    (key_id, json.dumps(key_data))
+                )
+                for name in COUNTER_FIELDS:
+                    conn.execute(
+                        "INSERT INTO key_counters (key_id, name, value) VALUES (?, ?, ?)",
+                        (key_id, name, int(key_data.get(name, 0) or 0))
+                    )
+
+    def close(self):
+        """Закрыть соединения"""
+        with self.connections_lock:
+            for conn in self.connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self.connections.clear()
+        self.local = threading.local()
+
+
+class SqliteTransaction:
+    """BEGIN IMMEDIATE ... COMMIT / ROLLBACK (с отметкой записи в store_meta)"""
+
+    def __init__(self, conn, store=None):
+        self.conn = conn
+        self.store = store
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            if self.store:
+                self.store.record_commit(self.conn)
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
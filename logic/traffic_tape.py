@@ -0,0 +1,355 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from requests.structures import CaseInsensitiveDict
+
+
+def redact_headers(headers):
+    """Заголовки запроса без ключа: Authorization -> Bearer ...<последние 8 символов>"""
+    redacted = {}
+    for name, value in (headers or {}).items():
+        if name.lower() == "authorization":
+            value = f"Bearer ...{str(value)[-8:]}"
+        redacted[name] = value
+    return redacted
+
+
+def request_fingerprint(payload):
+    """Отпечаток запроса: модель + сообщения (температура и stream не влияют -
+    ответ при воспроизведении переводится в режим запроса)"""
+    payload = payload or {}
+    body = json.dumps(
+        {"model": payload.get("model"), "messages": payload.get("messages")},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def sse_to_json(body):
+    """Потоковый ответ (строки SSE) -> тело обычного ответа chat/completions"""
+    parts = []
+    usage = None
+    finish_reason = None
+    for line in body.split("\n"):
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        event = json.loads(data)
+        usage = event.get("usage") or event.get("x_groq", {}).get("usage") or usage
+        for choice in event.get("choices", []):
+            parts.append(choice.get("delta", {}).get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+    return json.dumps({
+        "object": "chat.completion",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(parts)},
+            "finish_reason": finish_reason or "stop"
+        }],
+        "usage": usage
+    }, ensure_ascii=False)
+
+
+def json_to_sse(body):
+    """Тело обычного ответа -> строки SSE (весь текст одним событием, usage - в последнем)"""
+    data = json.loads(body)
+    choice = data["choices"][0]
+    events = [
+        {"choices": [{"index": 0, "delta": {"content": choice["message"]["content"]}}]},
+        {"choices": [{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason", "stop")}],
+         "x_groq": {"usage": data.get("usage")}}
+    ]
+    lines = []
+    for event in events:
+        lines.extend((f"data: {json.dumps(event, ensure_ascii=False)}", ""))
+    lines.append("data: [DONE]")
+    return "\n".join(lines)
+
+
+def read_tape(path):
+    """Записи ленты по порядку (битые строки пропускаются)"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def replay_workspace(path):
+    """Временные файлы ключей и лимитов для воспроизведения ленты: (keys_file, limits_file).
+
+    Ключи - заглушки, по одному на ключ, записанный на ленте. Записанные заголовки
+    x-ratelimit-* и 429 попадают в этот файл лимитов, а не в настоящее состояние ключей.
+    """
+    key_ids = {entry.get("key_id") for entry in read_tape(path) if entry.get("key_id")}
+    work_dir = Path(tempfile.mkdtemp(prefix="groq_replay_"))
+    keys_file = work_dir / "API_keys.txt"
+    keys_file.write_text(
+        "\n".join(f"gsk_replay_{i:024d}" for i in range(max(1, len(key_ids)))) + "\n", encoding="utf-8"
+    )
+    return str(keys_file), str(work_dir / "keys_limits.json")
+
+
+class TapeRecorder:
+    """Запись HTTP-трафика клиента в JSONL-ленту.
+
+    Обёртка над SessionPool: каждый POST пишется одной строкой - запрос (без ключа),
+    код, заголовки и тело ответа, время ответа и смещение от начала записи.
+    Потоковый ответ записывается при закрытии: строки SSE, которые клиент успел прочитать.
+    """
+
+    def __init__(self, http, path, logger=None):
+        self.http = http
+        self.path = path
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.started = time.monotonic()
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.log(f"📼 Запись трафика в {path}", "info")
+
+    def __getattr__(self, name):
+        # warm_up, evict_idle, get, pool_size - как у SessionPool
+        return getattr(self.http, name)
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def post(self, api_key, url, **kwargs):
+        """POST через пул с записью на ленту"""
+        offset = time.monotonic() - self.started
+        started = time.monotonic()
+        response = self.http.post(api_key, url, **kwargs)
+        elapsed = time.monotonic() - started
+
+        entry = {
+            "t": round(offset, 4),
+            "key_id": api_key[-8:] if api_key else None,
+            "method": "POST",
+            "url": url,
+            "request_headers": redact_headers(kwargs.get("headers")),
+            "request": kwargs.get("json"),
+            "status": response.status_code,
+            "headers": dict(response.headers),
+            "elapsed": round(elapsed, 4),
+            "stream": bool(kwargs.get("stream")) and response.status_code == 200
+        }
+
+        if entry["stream"]:
+            return RecordingStream(response, lambda lines, truncated: self.finish_stream(entry, lines, truncated))
+
+        entry["body"] = response.text
+        self.write(entry)
+        return response
+
+    def finish_stream(self, entry, lines, truncated):
+        """Записать потоковый ответ после закрытия"""
+        entry["body"] = "\n".join(lines)
+        entry["truncated"] = truncated
+        self.write(entry)
+
+    def write(self, entry):
+        """Добавить запись на ленту"""
+        with self.lock:
+            self.seq += 1
+            entry["seq"] = self.seq
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        """Закрыть ленту и пул"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        self.http.close()
+
+
+class RecordingStream:
+    """Потоковый ответ, строки которого копируются для ленты"""
+
+    def __init__(self, response, on_close):
+        self.response = response
+        self.on_close = on_close
+        self.lines = []
+        self.done = False
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def iter_lines(self, **kwargs):
+        """Строки SSE с копированием"""
+        for line in self.response.iter_lines(**kwargs):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            self.lines.append(line)
+            yield line
+        self.done = True
+
+    def close(self):
+        """Закрыть соединение и записать ответ"""
+        self.response.close()
+        if not self.closed:
+            self.closed = True
+            self.on_close(self.lines, not self.done)
+
+
+class ReplayResponse:
+    """Ответ с ленты (то, что клиент читает у requests.Response)"""
+
+    def __init__(self, entry, stream=None):
+        self.status_code = entry.get("status", 200)
+        self.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        self.text = entry.get("body") or ""
+
+        # Запрос повторяется в другом режиме, чем записан (--stream и без него) -
+        # ответ переводится между SSE и JSON
+        recorded_stream = bool(entry.get("stream"))
+        if stream is not None and self.status_code == 200 and bool(stream) != recorded_stream:
+            self.text = json_to_sse(self.text) if stream else sse_to_json(self.text)
+            self.headers["Content-Type"] = "text/event-stream" if stream else "application/json"
+        self.content = self.text.encode("utf-8")
+
+    def json(self):
+        """Тело как JSON"""
+        return json.loads(self.text)
+
+    def iter_lines(self, decode_unicode=False, **kwargs):
+        """Строки тела (для SSE)"""
+        for line in self.text.split("\n"):
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def close(self):
+        """Соединения нет - закрывать нечего"""
+
+
+class TapeReplayer:
+    """Транспорт, который отвечает с ленты вместо Groq API.
+
+    Ответ подбирается по отпечатку запроса (модель + сообщения), записи с одним
+    отпечатком выдаются по порядку - так повторяются и записанные 429 с последующим
+    успехом. Запрос, которого нет на ленте, получает следующую неиспользованную
+    запись (strict=False) или 404 (strict=True). Задержка ответа - записанная,
+    делённая на speed; speed=0 - без задержек. Потоковый ответ на обычный запрос
+    (и наоборот) переводится между SSE и JSON. Настоящие ключи не нужны (KeyManager -
+    на заглушках из replay_workspace) и в сеть ничего не уходит.
+    """
+
+    def __init__(self, path, speed=1.0, strict=False, logger=None):
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self.logger = logger
+        self.pool_size = 1
+        self.lock = threading.Lock()
+
+        self.entries = [entry for entry in read_tape(path) if entry.get("method", "POST") == "POST"]
+        self.by_fingerprint = {}
+        for index, entry in enumerate(self.entries):
+            fingerprint = request_fingerprint(entry.get("request"))
+            self.by_fingerprint.setdefault(fingerprint, deque()).append(index)
+        self.used = set()
+        self.next_unused = 0
+        self.matched = 0
+        self.unmatched = 0
+
+        self.log(f"📼 Воспроизведение ленты {path}: {len(self.entries)} записей, скорость x{speed}", "info")
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def take_entry(self, payload):
+        """Запись для запроса или None"""
+        with self.lock:
+            queue = self.by_fingerprint.get(request_fingerprint(payload))
+            while queue:
+                index = queue.popleft()
+                if index not in self.used:
+                    self.used.add(index)
+                    self.matched += 1
+                    return self.entries[index]
+
+            self.unmatched += 1
+            if self.strict:
+                return None
+            while self.next_unused < len(self.entries) and self.next_unused in self.used:
+                self.next_unused += 1
+            if self.next_unused >= len(self.entries):
+                return None
+            self.used.add(self.next_unused)
+            return self.entries[self.next_unused]
+
+    def post(self, api_key, url, json=None, **kwargs):
+        """Ответ с ленты с записанной (или масштабированной) задержкой"""
+        entry = self.take_entry(json)
+        if entry is None:
+            return ReplayResponse({
+                "status": 404,
+                "body": '{"error": {"message": "request not found on tape"}}'
+            })
+
+        if self.speed and entry.get("elapsed"):
+            time.sleep(entry["elapsed"] / self.speed)
+        try:
+            return ReplayResponse(entry, stream=bool((json or {}).get("stream") or kwargs.get("stream")))
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self.log(f"❌ Запись #{entry.get('seq')} на ленте не переводится между SSE и JSON: {str(e)}", "error")
+            return ReplayResponse({
+                "status": 500,
+                "body": '{"error": {"message": "tape entry cannot be converted to the requested mode"}}'
+            })
+
+    def get(self, api_key, url, **kwargs):
+        """GET в ленте не записывается"""
+        return ReplayResponse({"status": 404, "body": "{}"})
+
+    def warm_up(self, api_keys, url, connections=1):
+        """Соединений нет - прогревать нечего"""
+        return 0
+
+    def evict_idle(self):
+        """Соединений нет"""
+
+    def get_stats(self):
+        """Сколько запросов нашлось на ленте по отпечатку"""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "matched": self.matched,
+                "unmatched": self.unmatched,
+                "unused": len(self.entries) - len(self.used)
+            }
+
+    def close(self):
+        """Итог воспроизведения в лог"""
+        stats = self.get_stats()
+        self.log(
+            f"📼 Лента: совпало {stats['matched']}, без совпадения {stats['unmatched']}, "
+            f"не использовано {stats['unused']} из {stats['entries']}",
+            "info"
+        )
@@ -1,8 +1,8 @@
 """
 Groq Prompt Generator v3.0
-Главный файл запуска приложения
+Главный файл запуска приложения (GUI).
+Обработка без GUI (серверы без Tk): python -m cli
 """
-import tkinter as tk
 import os
 import sys
 from pathlib import Path
@@ -18,8 +18,8 @@ from config.settings import ConfigManager
 from logic.key_manager import KeyManager
 from logic.api_client import GroqAPIClient
 from logic.file_processor import FileProcessor
-from gui.main_window import MainWindow
-from utils.hotkeys import HotkeyManager
+from logic.response_cache import ResponseCache
+from logic.traffic_tape import replay_workspace
 from utils.lock_file import LockFileManager
 from utils.logger import Logger
 
@@ -33,6 +33,11 @@ def main():
         print("🧹 Режим разработки - очистка кэша Python...")
         cleanup_on_startup(dev_mode=True)
     
+    # Tk загружается только здесь - остальные модули импортируются и без него
+    import tkinter as tk
+    from gui.main_window import MainWindow
+    from utils.hotkeys import HotkeyManager
+    
     # Создание главного окна
     root = tk.Tk()
     
@@ -44,17 +49,31 @@ def main():
     # 2. Загрузка конфигурации
     config = ConfigManager()
     
-    # 3. Инициализация менеджера ключей
-    keys = KeyManager()
-    
-    # 4. Создание логгера
+    # 3. Создание логгера
     logger = Logger()
     
+    # 4. Инициализация менеджера ключей (файл ключей отслеживается по изменениям)
+    if config.get("traffic_replay"):
+        # Воспроизведение ленты: ключи-заглушки и свой файл лимитов, настоящее состояние не трогаем
+        keys_file, limits_file = replay_workspace(config.get("traffic_replay"))
+        keys = KeyManager(keys_file=keys_file, limits_file=limits_file, logger=logger, watch_interval=0)
+    else:
+        keys = KeyManager(
+            backend=config.get("state_backend", "json"),
+            logger=logger,
+            watch_interval=config.get("keys_watch_interval", 2.0)
+        )
+    
     # 5. Создание API клиента
-    api_client = GroqAPIClient(keys, logger)
+    api_client = GroqAPIClient(keys, logger, config)
     
-    # 6. Создание обработчика файлов
-    file_processor = FileProcessor(api_client, logger)
+    # 6. Создание обработчика файлов (с кэшем ответов)
+    response_cache = ResponseCache(
+        max_size_mb=config.get("response_cache_max_mb", 200),
+        max_age_days=config.get("response_cache_max_age_days", 30),
+        logger=logger
+    )
+    file_processor = FileProcessor(api_client, logger, response_cache)
     
     # 7. Создание главного окна
     app = MainWindow(root, config, keys, api_client, file_processor, logger)
@@ -64,6 +83,9 @@ def main():
     
     # 9. Обработка закрытия окна
     def on_closing():
+        keys.close()
+        api_client.http.close()
+        logger.close()
         lock_manager.cleanup()
         root.destroy()
     
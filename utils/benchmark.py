@@ -0,0 +1,296 @@
+"""
+Бенчмарк конвейера на локальном mock-сервере (без расхода квоты).
+
+Генерирует папку синтетических чанков и ключей, поднимает MockGroqServer и прогоняет
+файлы через GroqAPIClient + FileProcessor + ConcurrentDispatcher так же, как GUI.
+Печатает пропускную способность, p50/p95/p99 задержек и число повторов.
+
+Запуск: python -m utils.benchmark --chunks 200 --keys 8 --latency lognormal:0.4:0.5 --error-429 0.05
+
+Лента трафика (logic/traffic_tape.py): --record tape.jsonl пишет прогон на ленту,
+--replay tape.jsonl повторяет записанную сессию (в том числе боевую) без сети и ключей:
+чанки, системный промпт и модель берутся с ленты, ответы - тоже.
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from logic.api_client import GroqAPIClient
+from logic.dispatcher import ConcurrentDispatcher
+from logic.file_processor import FileProcessor, PACK_HEADER_PATTERN
+from logic.key_manager import KeyManager
+from logic.traffic_tape import read_tape
+from utils.mock_groq_server import MockGroqServer
+
+WORDS = (
+    "river", "mountain", "forest", "city", "light", "shadow", "ancient", "quiet", "storm", "glass",
+    "город", "река", "лес", "свет", "тень", "древний", "тихий", "буря", "стекло", "дорога"
+)
+
+
+class QuietLogger:
+    """Логгер, который ничего не выводит (сотни строк на прогон мешают читать результат)"""
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if level == "error":
+            print(message)
+
+
+def percentile(values, fraction):
+    """Перцентиль (ближайший ранг); None для пустого списка"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_chunks(folder, count, words_per_chunk, seed=0):
+    """Синтетические чанки"""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(words_per_chunk))
+        (folder / f"chunk_{i:05d}.txt").write_text(text, encoding="utf-8")
+
+
+def write_chunks(folder, texts):
+    """Чанки с заданным текстом"""
+    folder.mkdir(parents=True, exist_ok=True)
+    for i, text in enumerate(texts):
+        (folder / f"chunk_{i:05d}.txt").write_text(text, encoding="utf-8")
+
+
+def tape_workload(path):
+    """Нагрузка записанной сессии: (модель, системный промпт, тексты чанков).
+
+    Упакованные запросы разбираются обратно на чанки по заголовкам разделов.
+    """
+    models = Counter()
+    system_prompt = ""
+    texts = []
+    seen = set()
+
+    for entry in read_tape(path):
+        payload = entry.get("request") or {}
+        messages = payload.get("messages") or []
+        if len(messages) < 2:
+            continue
+        models[payload.get("model")] += 1
+        system_prompt = system_prompt or messages[0].get("content", "")
+
+        user_message = messages[-1].get("content", "")
+        headers = list(PACK_HEADER_PATTERN.finditer(user_message))
+        if headers:
+            sections = [
+                user_message[match.end():headers[i + 1].start() if i + 1 < len(headers) else len(user_message)]
+                for i, match in enumerate(headers)
+            ]
+        else:
+            sections = [user_message]
+
+        for text in sections:
+            text = text.strip()
+            if text and text not in seen:
+                seen.add(text)
+                texts.append(text)
+
+    model = models.most_common(1)[0][0] if models else None
+    return model, system_prompt, texts
+
+
+class RequestRecorder:
+    """Обёртка над SessionPool.post: время и код каждого HTTP-запроса"""
+
+    def __init__(self, http):
+        self.http = http
+        self.post_original = http.post
+        self.latencies = []
+        self.statuses = Counter()
+        self.lock = threading.Lock()
+        http.post = self.post
+
+    def post(self, api_key, url, **kwargs):
+        """POST с замером"""
+        started = time.perf_counter()
+        try:
+            response = self.post_original(api_key, url, **kwargs)
+        except Exception:
+            with self.lock:
+                self.statuses["exception"] += 1
+            raise
+        with self.lock:
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[response.status_code] += 1
+        return response
+
+
+def run_benchmark(chunks=100, keys=5, model="llama-3.1-8b-instant", concurrency=0, latency="lognormal:0.4:0.5",
+                  error_429=0.0, error_401=0.0, error_500=0.0, limit_scale=1.0, words_per_chunk=150,
+                  prompts_count=5, pack=False, stream=False, backend="json", work_dir=None, logger=None,
+                  record=None, replay=None, replay_speed=1.0):
+    """Один прогон бенчмарка, результат - dict с метриками.
+
+    record - путь ленты для записи трафика, replay - путь ленты, которая заменяет mock-сервер.
+    """
+    logger = logger or QuietLogger()
+    own_dir = work_dir is None
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix="groq_bench_"))
+    chunks_folder = work_dir / "chunks"
+    output_folder = work_dir / "prompts"
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    system_prompt = "Write {n} prompts for the text."
+    if replay:
+        tape_model, system_prompt, texts = tape_workload(replay)
+        model = tape_model or model
+        write_chunks(chunks_folder, texts)
+    else:
+        make_chunks(chunks_folder, chunks, words_per_chunk)
+
+    keys_file = work_dir / "API_keys.txt"
+    keys_file.write_text("\n".join(f"gsk_bench_{i:024d}" for i in range(keys)) + "\n", encoding="utf-8")
+
+    mock = None
+    client_config = {"http_warm_up": False}
+    if replay:
+        client_config.update(traffic_replay=replay, traffic_replay_speed=replay_speed)
+    else:
+        mock = MockGroqServer(
+            latency=latency, error_429=error_429, error_401=error_401, error_500=error_500,
+            limit_scale=limit_scale, prompts_per_answer=prompts_count
+        )
+        mock.start()
+        client_config["api_url"] = mock.chat_url
+        if record:
+            client_config["traffic_record"] = record
+
+    key_manager = KeyManager(
+        keys_file=str(keys_file), limits_file=str(work_dir / "keys_limits.json"),
+        backend=backend, logger=logger, watch_interval=0
+    )
+    client = GroqAPIClient(key_manager, logger, client_config)
+    recorder = RequestRecorder(client.http)
+    processor = FileProcessor(client, logger)
+
+    files = processor.get_files_to_process(str(chunks_folder))
+    common = dict(
+        output_folder=str(output_folder), system_prompt=system_prompt, model=model,
+        temperature=0.7, prompts_count=prompts_count, use_cache=False
+    )
+
+    def worker(item):
+        if isinstance(item, list):
+            return processor.process_pack(item, **common)
+        return processor.process_file(item, stream=stream, **common)
+
+    file_times = []
+    file_statuses = Counter()
+
+    def on_file_done(file_path, success, status, elapsed):
+        file_statuses[status] += 1
+        if success:
+            file_times.append(elapsed)
+
+    items = processor.plan_packs(files) if pack else files
+    dispatcher = ConcurrentDispatcher(key_manager, logger, max_in_flight=concurrency, model=model)
+
+    started = time.perf_counter()
+    try:
+        dispatcher.run(items, worker, on_file_done=on_file_done)
+    finally:
+        wall = time.perf_counter() - started
+        key_manager.close()
+        tape_stats = client.http.get_stats() if replay else None
+        client.http.close()
+        if mock:
+            mock.stop()
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    requests_sent = sum(recorder.statuses.values())
+    result = {
+        "files": len(files),
+        "succeeded": sum(file_statuses[status] for status in ("success", "cached")),
+        "file_statuses": dict(file_statuses),
+        "wall_seconds": round(wall, 3),
+        "files_per_second": round(len(file_times) / wall, 3) if wall else None,
+        "requests": requests_sent,
+        "retries": max(0, requests_sent - len(items)),
+        "http_statuses": {str(code): count for code, count in recorder.statuses.items()},
+        "request_latency": {
+            name: round(percentile(recorder.latencies, fraction), 4) if recorder.latencies else None
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        },
+        "file_latency": {
+            name: round(percentile(file_times, fraction), 4) if file_times else None
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        }
+    }
+    if tape_stats:
+        result["tape"] = tape_stats
+    return result
+
+
+def main():
+    """Запуск из командной строки"""
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки на mock Groq API")
+    parser.add_argument("--chunks", type=int, default=100)
+    parser.add_argument("--keys", type=int, default=5)
+    parser.add_argument("--model", default="llama-3.1-8b-instant")
+    parser.add_argument("--concurrency", type=int, default=0, help="0 = по числу ключей")
+    parser.add_argument("--latency", default="lognormal:0.4:0.5")
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-401", type=float, default=0.0)
+    parser.add_argument("--error-500", type=float, default=0.0)
+    parser.add_argument("--limit-scale", type=float, default=1.0)
+    parser.add_argument("--words", type=int, default=150, help="слов в чанке")
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--pack", action="store_true", help="упаковка чанков")
+    parser.add_argument("--stream", action="store_true", help="потоковые ответы")
+    parser.add_argument("--backend", default="json", choices=("json", "sqlite"))
+    parser.add_argument("--record", help="записать трафик на ленту (JSONL)")
+    parser.add_argument("--replay", help="воспроизвести ленту вместо mock-сервера")
+    parser.add_argument("--speed", type=float, default=1.0, help="скорость воспроизведения, 0 - без задержек")
+    parser.add_argument("--json", action="store_true", help="вывод в JSON")
+    parser.add_argument("--verbose", action="store_true", help="показывать лог обработки")
+    args = parser.parse_args()
+
+    logger = None
+    if args.verbose:
+        from utils.logger import Logger
+        logger = Logger()
+
+    result = run_benchmark(
+        chunks=args.chunks, keys=args.keys, model=args.model, concurrency=args.concurrency,
+        latency=args.latency, error_429=args.error_429, error_401=args.error_401, error_500=args.error_500,
+        limit_scale=args.limit_scale, words_per_chunk=args.words, prompts_count=args.prompts,
+        pack=args.pack, stream=args.stream, backend=args.backend, logger=logger,
+        record=args.record, replay=args.replay, replay_speed=args.speed
+    )
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return
+
+    print("\n" + "=" * 60)
+    print("📊 РЕЗУЛЬТАТ БЕНЧМАРКА")
+    print("=" * 60)
+    print(f"Файлов: {result['succeeded']}/{result['files']}  статусы: {result['file_statuses']}")
+    print(f"Время: {result['wall_seconds']} с  пропускная способность: {result['files_per_second']} файл/с")
+    print(f"HTTP-запросов: {result['requests']}  повторов: {result['retries']}  коды: {result['http_statuses']}")
+    print(f"Задержка запроса: {result['request_latency']}")
+    print(f"Время на файл:    {result['file_latency']}")
+    if "tape" in result:
+        print(f"Лента: {result['tape']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import sys
+
+
+def gui_active():
+    """Запущен ли GUI (создано окно Tk). Модуль tkinter здесь не импортируется:
+    без GUI (сервер, python -m cli) его может не быть вовсе."""
+    tkinter = sys.modules.get("tkinter")
+    return tkinter is not None and getattr(tkinter, "_default_root", None) is not None
+
+
+def beep(frequency, duration):
+    """Звуковой сигнал - только в GUI и только на Windows (winsound)"""
+    if not gui_active():
+        return
+    try:
+        import winsound
+    except ImportError:
+        return
+    winsound.Beep(frequency, duration)
+
+
+def show_error(title, message):
+    """Окно с ошибкой в GUI; без GUI - ничего (сообщение уже в логе). True - окно показано"""
+    if not gui_active():
+        return False
+    from tkinter import messagebox
+    messagebox.showerror(title, message)
+    return True
+
+
+def ask_yes_no(title, message, default=False):
+    """Вопрос да/нет в GUI; без GUI - ответ default"""
+    if not gui_active():
+        return default
+    from tkinter import messagebox
+    return messagebox.askyesno(title, message)
@@ -1,21 +1,35 @@
 import os
-from tkinter import messagebox
+
+from utils.desktop import ask_yes_no
 
 class LockFileManager:
     """Управление lock-файлом для предотвращения двойного запуска"""
     
-    def __init__(self, lock_file=".running"):
+    def __init__(self, lock_file=".running", logger=None):
         self.lock_file = lock_file
+        self.logger = logger
+    
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
     
-    def check_lock_file(self):
-        """Проверка существования lock файла"""
+    def check_lock_file(self, force=False):
+        """Проверка существования lock файла.
+        
+        В GUI спрашивает, продолжать ли запуск; без GUI запуск отменяется,
+        если не передан force=True.
+        """
         if os.path.exists(self.lock_file):
-            result = messagebox.askyesno(
+            result = force or ask_yes_no(
                 "⚠️ Программа уже запущена",
                 "Обнаружен файл блокировки. Другой экземпляр программы может быть запущен.\n\n"
                 "Продолжить запуск? (Это может привести к конфликтам данных)"
             )
             if not result:
+                self.log(f"⚠️ Обнаружен файл блокировки {self.lock_file}: другой экземпляр может быть запущен", "warning")
                 return False
             else:
                 os.remove(self.lock_file)
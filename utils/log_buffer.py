@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# Фильтры уровня для окна лога: название -> уровни, которые показываются
+LEVEL_FILTERS = {
+    "Все": None,
+    "Успех": ("success",),
+    "Предупреждения и ошибки": ("warning", "error"),
+    "Ошибки": ("error",)
+}
+
+
+class LogRecord:
+    """Строка лога с готовым к поиску текстом"""
+
+    __slots__ = ("text", "level", "search_text")
+
+    def __init__(self, text, level):
+        self.text = text
+        self.level = level
+        self.search_text = text.lower()
+
+    def matches(self, levels=None, query=""):
+        """Подходит ли строка под фильтр уровня и поиск (query - в нижнем регистре)"""
+        if levels and self.level not in levels:
+            return False
+        return not query or query in self.search_text
+
+
+class LogBuffer:
+    """Кольцевой буфер последних max_lines строк лога.
+
+    Вытесненные строки дописываются в файл с ротацией (spill_path, spill_max_mb,
+    spill_backups) - в памяти и в окне хранится не больше max_lines строк, вся
+    история остаётся на диске. Фильтр и поиск идут по буферу, а не по тексту виджета.
+    """
+
+    def __init__(self, max_lines=5000, spill_path="logs/app.log", spill_max_mb=5, spill_backups=3):
+        self.max_lines = max(100, int(max_lines))
+        self.records = deque()
+        self.spilled = 0
+        self.lock = threading.Lock()
+
+        self.spill_path = spill_path
+        self.spill = None
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            handler = RotatingFileHandler(
+                spill_path, maxBytes=int(spill_max_mb * 1024 * 1024), backupCount=spill_backups, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.spill = logging.getLogger(f"groq.log_spill.{id(self)}")
+            self.spill.propagate = False
+            self.spill.setLevel(logging.INFO)
+            self.spill.addHandler(handler)
+
+    def append(self, records):
+        """Добавить строки; старые сверх max_lines уходят в файл"""
+        evicted = []
+        with self.lock:
+            self.records.extend(records)
+            while len(self.records) > self.max_lines:
+                evicted.append(self.records.popleft())
+            self.spilled += len(evicted)
+        self.write_spill(evicted)
+
+    def write_spill(self, records):
+        """Дописать строки в файл (одна запись на пачку)"""
+        if not self.spill or not records:
+            return
+        self.spill.info("".join(f"{record.level.upper():<7} {record.text}" for record in records).rstrip("\n"))
+
+    def filtered(self, levels=None, query=""):
+        """Строки буфера под фильтром и поиском"""
+        query = query.lower()
+        with self.lock:
+            return [record for record in self.records if record.matches(levels, query)]
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        """Сбросить оставшиеся в буфере строки в файл (при закрытии программы)"""
+        with self.lock:
+            records = list(self.records)
+            self.records.clear()
+        self.write_spill(records)
+        if self.spill:
+            for handler in list(self.spill.handlers):
+                handler.close()
+                self.spill.removeHandler(handler)
+            self.spill = None
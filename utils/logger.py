@@ -1,23 +1,85 @@
+from collections import deque
 from datetime import datetime
 
+# Порядок уровней для фильтра min_level (success - как info)
+LEVELS = {"info": 0, "success": 0, "warning": 1, "error": 2}
+
+# Как часто UI-поток забирает накопившиеся строки, мс
+DRAIN_INTERVAL_MS = 100
+
+# Строк за один проход (остальные - в следующий, чтобы не подвесить окно)
+DRAIN_BATCH = 1000
+
+# Больше строк в очереди не копим (окно не успевает) - лишние отбрасываются
+MAX_PENDING = 20000
+
 class Logger:
-    """Простой логгер для записи сообщений"""
+    """Простой логгер для записи сообщений.
+
+    С окном лога (LogTab) и root строки не пишутся в Tk из рабочих потоков: log() только
+    кладёт запись в очередь (не блокируется), а UI-поток раз в DRAIN_INTERVAL_MS забирает
+    накопившееся через root.after и передаёт окну одной пачкой (LogTab.append).
+    """
     
-    def __init__(self, log_widget=None):
+    def __init__(self, log_widget=None, stream=None, min_level=None):
         self.log_widget = log_widget
+        # Без виджета: куда печатать (None - stdout) и с какого уровня
+        self.stream = stream
+        self.min_level = min_level
+        # Очередь (строка, уровень) для UI-потока; deque.append/popleft потокобезопасны
+        self.pending = deque()
+        self.dropped = 0
+        self.root = None
     
-    def set_widget(self, log_widget):
-        """Установить виджет для вывода логов"""
+    def set_widget(self, log_widget, root=None):
+        """Установить окно лога (append/close); с root - вывод через очередь и root.after"""
         self.log_widget = log_widget
+        self.root = root
+        if root is not None:
+            self.root.after(DRAIN_INTERVAL_MS, self.drain)
+    
+    def drain(self):
+        """Перенести накопившиеся строки в виджет (только из UI-потока)"""
+        try:
+            self.flush_pending()
+        finally:
+            self.root.after(DRAIN_INTERVAL_MS, self.drain)
+    
+    def flush_pending(self):
+        """Передать в окно лога до DRAIN_BATCH строк одной пачкой"""
+        if not self.pending and not self.dropped:
+            return
+        
+        batch = [self.pending.popleft() for _ in range(min(len(self.pending), DRAIN_BATCH))]
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            batch.append((f"[{timestamp}] ⚠️ Пропущено строк лога: {dropped} (окно не успевало)\n", "warning"))
+        self.log_widget.append(batch)
+    
+    def close(self):
+        """Дописать очередь в окно и окно - в файл (из UI-потока при закрытии)"""
+        if not self.log_widget:
+            return
+        while self.pending or self.dropped:
+            self.flush_pending()
+        self.log_widget.close()
     
     def log(self, message, level="info"):
         """Вывод сообщения в лог"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         full_message = f"[{timestamp}] {message}\n"
         
-        if self.log_widget:
-            self.log_widget.insert("end", full_message, level)
-            self.log_widget.see("end")
+        if self.log_widget and self.root is not None:
+            # Из любого потока: только в очередь, Tk трогает UI-поток
+            if len(self.pending) >= MAX_PENDING:
+                self.dropped += 1
+            else:
+                self.pending.append((full_message, level))
+        elif self.log_widget:
+            self.log_widget.append([(full_message, level)])
         else:
             # Если виджет не установлен, выводим в консоль
-            print(full_message.strip())
+            if self.min_level and LEVELS.get(level, 0) < LEVELS.get(self.min_level, 0):
+                return
+            print(full_message.strip(), file=self.stream, flush=True)
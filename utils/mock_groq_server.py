@@ -0,0 +1,346 @@
+"""
+Локальная замена Groq API (OpenAI-совместимый /chat/completions) для бенчмарков.
+
+Задержка ответа, доля ошибок 429/401/500 и лимиты RPM/RPD/TPM настраиваются;
+заголовки x-ratelimit-* отдаются как у настоящего Groq. Квота не тратится.
+
+Запуск: python -m utils.mock_groq_server --port 8765 --latency lognormal:0.4:0.5 --error-429 0.02
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logic.model_limits import MODEL_LIMITS
+
+CHAT_PATH = "/openai/v1/chat/completions"
+MODELS_PATH = "/openai/v1/models"
+
+# Заголовки разделов упакованного запроса (FileProcessor.build_packed_message)
+PACK_HEADER_LINE = re.compile(r"^### CHUNK (\d+) ###$", re.MULTILINE)
+
+
+def parse_latency(spec):
+    """Распределение задержки из строки -> функция без аргументов (секунды).
+
+    fixed:0.3 | uniform:0.1:0.8 | lognormal:<медиана>:<sigma> | exp:<среднее> | 0.3
+    """
+    parts = str(spec).split(":")
+    kind = parts[0]
+    args = [float(value) for value in parts[1:]]
+
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(args[0]), args[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / args[0])
+    if kind == "fixed":
+        return lambda: args[0]
+    value = float(kind)
+    return lambda: value
+
+
+def format_duration(seconds):
+    """Время сброса в формате Groq: '2m59.56s' / '7.66s' / '120ms'"""
+    if seconds < 1:
+        return f"{int(seconds * 1000)}ms"
+    minutes, rest = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    text = ""
+    if hours:
+        text += f"{hours}h"
+    if hours or minutes:
+        text += f"{minutes}m"
+    return text + f"{rest:.2f}s"
+
+
+class MockQuota:
+    """Лимиты одной пары ключ+модель: RPM (скользящее окно), RPD (сутки), TPM (корзина)"""
+
+    def __init__(self, limits, scale=1.0):
+        self.rpm = max(1, int(limits["rpm"] * scale))
+        self.rpd = max(1, int(limits["rpd"] * scale))
+        self.tpm = max(1, int(limits["tpm"] * scale))
+        self.minute_requests = deque()
+        self.day_started = time.monotonic()
+        self.day_requests = 0
+        self.tokens = float(self.tpm)
+        self.tokens_updated = time.monotonic()
+
+    def refill(self, now):
+        """Пополнить окна на момент now"""
+        while self.minute_requests and now - self.minute_requests[0] >= 60:
+            self.minute_requests.popleft()
+        if now - self.day_started >= 86400:
+            self.day_started = now
+            self.day_requests = 0
+        self.tokens = min(self.tpm, self.tokens + (now - self.tokens_updated) * self.tpm / 60)
+        self.tokens_updated = now
+
+    def check(self, tokens, now):
+        """Сколько ждать до допуска запроса (0 - можно сейчас)"""
+        self.refill(now)
+        waits = [0.0]
+        if len(self.minute_requests) >= self.rpm:
+            waits.append(60 - (now - self.minute_requests[0]))
+        if self.day_requests >= self.rpd:
+            waits.append(86400 - (now - self.day_started))
+        if self.tokens < min(tokens, self.tpm):
+            waits.append((min(tokens, self.tpm) - self.tokens) * 60 / self.tpm)
+        return max(waits)
+
+    def consume(self, tokens, now):
+        """Засчитать запрос"""
+        self.minute_requests.append(now)
+        self.day_requests += 1
+        self.tokens -= min(tokens, self.tpm)
+
+    def headers(self, now):
+        """Заголовки x-ratelimit-* (requests - суточное окно, tokens - минутное)"""
+        remaining_tokens = max(0, int(self.tokens))
+        return {
+            "x-ratelimit-limit-requests": str(self.rpd),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpd - self.day_requests)),
+            "x-ratelimit-reset-requests": format_duration(
+                (86400 - (now - self.day_started)) * self.day_requests / self.rpd
+            ),
+            "x-ratelimit-limit-tokens": str(self.tpm),
+            "x-ratelimit-remaining-tokens": str(remaining_tokens),
+            "x-ratelimit-reset-tokens": format_duration((self.tpm - remaining_tokens) * 60 / self.tpm)
+        }
+
+
+class MockGroqServer:
+    """Сервер в фоновом потоке: start() -> base_url, stop()"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="lognormal:0.4:0.5", error_429=0.0, error_401=0.0,
+                 error_500=0.0, invalid_keys=(), limit_scale=1.0, prompts_per_answer=None, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = parse_latency(latency)
+        self.error_rates = {429: error_429, 401: error_401, 500: error_500}
+        self.invalid_keys = set(invalid_keys)
+        self.limit_scale = limit_scale
+        self.prompts_per_answer = prompts_per_answer
+        self.random = random.Random(seed)
+        self.quotas = {}
+        self.lock = threading.Lock()
+        self.status_counts = Counter()
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """Адрес сервера"""
+        return f"http://{self.host}:{self.server.server_address[1]}"
+
+    @property
+    def chat_url(self):
+        """URL chat/completions"""
+        return self.base_url + CHAT_PATH
+
+    def start(self):
+        """Запустить сервер в фоне"""
+        handler = type("MockGroqHandler", (MockGroqHandler,), {"mock": self})
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-groq", daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        """Остановить сервер"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def get_quota(self, api_key, model):
+        """Лимиты пары ключ+модель (под lock)"""
+        pair = (api_key, model)
+        if pair not in self.quotas:
+            limits = MODEL_LIMITS.get(model, {"rpm": 30, "rpd": 1000, "tpm": 6000})
+            self.quotas[pair] = MockQuota(limits, self.limit_scale)
+        return self.quotas[pair]
+
+    def count(self, status):
+        """Статистика ответов по кодам"""
+        with self.lock:
+            self.status_counts[status] += 1
+
+    def build_answer(self, payload):
+        """Текст ответа: нумерованный список промптов"""
+        count = self.prompts_per_answer
+        if count is None:
+            # Число промптов из системного промпта ("... 10 ...") или 5
+            numbers = [int(word) for word in payload["messages"][0]["content"].split() if word.isdigit()]
+            count = numbers[0] if numbers else 5
+        prompts = "\n".join(
+            f"{i}. Synthetic prompt number {i} describing a scene in vivid detail" for i in range(1, count + 1)
+        )
+
+        # Упакованный запрос - отвечаем на каждый чанк под его заголовком
+        chunks = PACK_HEADER_LINE.findall(payload["messages"][-1]["content"])
+        if not chunks:
+            return prompts
+        return "\n\n".join(f"### CHUNK {index} ###\n{prompts}" for index in chunks)
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов (mock подставляется при создании класса)"""
+
+    mock = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Без вывода каждого запроса в консоль"""
+
+    def send_json(self, status, body, headers=None):
+        """JSON-ответ"""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.mock.count(status)
+
+    def do_HEAD(self):
+        """Прогрев соединений"""
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        """Список моделей"""
+        if self.path != MODELS_PATH:
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        self.send_json(200, {"data": [{"id": model, "object": "model"} for model in MODEL_LIMITS]})
+
+    def do_POST(self):
+        """chat/completions"""
+        mock = self.mock
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        if self.path != CHAT_PATH:
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        api_key = self.headers.get("Authorization", "").replace("Bearer ", "")
+        model = payload.get("model", "")
+        if not api_key or api_key in mock.invalid_keys or mock.random.random() < mock.error_rates[401]:
+            self.send_json(401, {"error": {"message": "Invalid API Key"}})
+            return
+
+        if mock.random.random() < mock.error_rates[500]:
+            self.send_json(500, {"error": {"message": "Internal Server Error"}})
+            return
+
+        answer = mock.build_answer(payload)
+        prompt_tokens = sum(len(message.get("content", "")) for message in payload.get("messages", [])) // 4 + 1
+        completion_tokens = len(answer) // 4 + 1
+        total_tokens = prompt_tokens + completion_tokens
+
+        now = time.monotonic()
+        with mock.lock:
+            quota = mock.get_quota(api_key, model)
+            wait = quota.check(total_tokens, now)
+            injected = wait <= 0 and mock.random.random() < mock.error_rates[429]
+            if wait <= 0 and not injected:
+                quota.consume(total_tokens, now)
+            headers = quota.headers(now)
+
+        if wait > 0 or injected:
+            headers["retry-after"] = str(max(1, math.ceil(wait)) if wait > 0 else 1)
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens"}}, headers)
+            return
+
+        latency = max(0.0, mock.latency())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "queue_time": round(latency * 0.1, 4),
+            "total_time": round(latency, 4)
+        }
+
+        if payload.get("stream"):
+            self.send_stream(answer, usage, headers, latency)
+            return
+
+        time.sleep(latency)
+        self.send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": usage
+        }, headers)
+
+    def send_stream(self, answer, usage, headers, latency):
+        """Ответ потоком SSE: куски по несколько символов, usage - в последнем событии"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        pieces = [answer[i:i + 16] for i in range(0, len(answer), 16)]
+        delay = latency / max(1, len(pieces))
+        try:
+            for piece in pieces:
+                time.sleep(delay)
+                event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент оборвал генерацию досрочно
+            pass
+        self.mock.count(200)
+
+
+def main():
+    """Запуск сервера из командной строки"""
+    parser = argparse.ArgumentParser(description="Локальная замена Groq API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.4:0.5",
+                        help="fixed:S | uniform:A:B | lognormal:MEDIAN:SIGMA | exp:MEAN")
+    parser.add_argument("--error-429", type=float, default=0.0, help="доля случайных 429")
+    parser.add_argument("--error-401", type=float, default=0.0, help="доля случайных 401")
+    parser.add_argument("--error-500", type=float, default=0.0, help="доля случайных 500")
+    parser.add_argument("--limit-scale", type=float, default=1.0, help="множитель лимитов MODEL_LIMITS")
+    args = parser.parse_args()
+
+    mock = MockGroqServer(
+        args.host, args.port, args.latency, args.error_429, args.error_401, args.error_500,
+        limit_scale=args.limit_scale
+    )
+    print(f"🧪 Mock Groq API: {mock.start()}{CHAT_PATH}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,11 @@ class ModelValidator:
         "gemma2-9b-it"  # Вышла из строя 2025-10-08
     ]
     
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, session_pool=None):
         self.logger = logger
         self.api_url = "https://api.groq.com/openai/v1/models"
+        # Пул keep-alive сессий клиента (GroqAPIClient.http), если передан
+        self.session_pool = session_pool
     
     def log(self, message, level="info"):
         """Вывод в лог"""
@@ -36,7 +38,10 @@ class ModelValidator:
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             }
-            response = requests.get(self.api_url, headers=headers, timeout=10)
+            if self.session_pool:
+                response = self.session_pool.get(api_key, self.api_url, headers=headers, timeout=10)
+            else:
+                response = requests.get(self.api_url, headers=headers, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -128,4 +133,5 @@ class ModelValidator:
             return True
         
         except Exception as e:
-            self.log(f"❌
+            self.log(f"❌ Ошибка обновления config: {str(e)}", "error")
+            return False